@@ -0,0 +1,202 @@
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import traceback
+
+###############################################################################################
+# background_fit.py
+# Runs UMAP fits in a separate worker process so the Streamlit page stays responsive while a
+# layout is computed. One long-lived worker serves the whole server (FitWorker): it imports umap
+# once, keeps numba's compiled code and an in-memory LayoutCache warm between fits, and runs the
+# fit jobs it is sent one at a time. Jobs arrive as JSON lines on its stdin and progress goes back
+# as JSON lines on stdout, tagged with the job ID. The result is stored in the on-disk LayoutCache.
+# Each Streamlit session has one FitScheduler: requesting a fit for new slider values cancels the
+# job it supersedes, so dragging a slider doesn't pile up work. A cancelled job is skipped if it
+# has not started yet, or stops at its next progress report.
+###############################################################################################
+
+# The worker is a separate interpreter running this file. Forking the multi-threaded Streamlit server
+# is not safe, and multiprocessing's spawn would re-run the Streamlit script (it is __main__).
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+class FitCancelled(Exception):
+    """Raised inside the worker when the running job has been cancelled"""
+
+
+def _worker_main():
+    """Worker process entry point: run fit jobs from stdin until the server closes it"""
+    from layout_cache import LayoutCache
+    from umap_layout import fit_layout
+
+    jobs = queue.Queue()
+    cancelled = set()
+    output_lock = threading.Lock()
+
+    def report(job_id, state, fraction, message):
+        with output_lock:
+            print(json.dumps([job_id, state, fraction, message]), flush=True)
+
+    def read_commands():
+        for line in sys.stdin:
+            command = json.loads(line)
+            if command['op'] == 'cancel':
+                cancelled.add(command['job'])
+            else:
+                jobs.put(command)
+        # The server is gone; don't leave an orphaned fit running
+        os._exit(0)
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    layout_cache = LayoutCache()
+
+    while True:
+        job = jobs.get()
+        job_id = job['job']
+        if job_id in cancelled:
+            report(job_id, 'cancelled', 0.0, "Cancelled")
+            continue
+
+        def progress(fraction, message):
+            if job_id in cancelled:
+                raise FitCancelled()
+            report(job_id, 'progress', fraction, message)
+
+        try:
+            fit_layout(layout_cache=layout_cache, progress=progress, **job['kwargs'])
+            report(job_id, 'done', 1.0, "Done")
+        except FitCancelled:
+            report(job_id, 'cancelled', 0.0, "Cancelled")
+        except Exception:
+            report(job_id, 'error', 0.0, traceback.format_exc())
+        cancelled.discard(job_id)
+
+
+class FitWorker:
+    """Server side of the long-lived worker process, shared by every session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        # job ID -> (worker process running it, queue of its reports)
+        self._jobs = {}
+        self._process = None
+
+    def _ensure_started(self):
+        # (Re)start the worker if it is not running, e.g. after a crash
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._process = subprocess.Popen([sys.executable, WORKER_SCRIPT], cwd=os.getcwd(),
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read_reports, args=(self._process,), daemon=True).start()
+
+    def _read_reports(self, process):
+        """Route the worker's progress lines to the queue of their job (runs in a thread)"""
+        for line in process.stdout:
+            try:
+                job_id, state, fraction, message = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is not None:
+                job[1].put((state, fraction, message))
+
+        # The worker exited; fail the jobs it was holding
+        process.wait()
+        with self._lock:
+            lost = [reports for job_process, reports in self._jobs.values() if job_process is process]
+        for reports in lost:
+            reports.put(('error', 0.0, f"Worker exited unexpectedly (exit code {process.returncode})"))
+
+    def _send(self, command):
+        self._process.stdin.write(json.dumps(command) + '\n')
+        self._process.stdin.flush()
+
+    def submit(self, fit_kwargs):
+        """Queue a fit; returns (job ID, queue of its (state, fraction, message) reports)"""
+        with self._lock:
+            self._ensure_started()
+            job_id = next(self._job_ids)
+            reports = queue.Queue()
+            self._jobs[job_id] = (self._process, reports)
+            self._send({'op': 'fit', 'job': job_id, 'kwargs': fit_kwargs})
+        return job_id, reports
+
+    def cancel(self, job_id):
+        """Cancel a queued or running fit"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            if self._process is not None and self._process.poll() is None:
+                try:
+                    self._send({'op': 'cancel', 'job': job_id})
+                except OSError:
+                    pass
+
+    def finish(self, job_id):
+        """Forget a job that has reported its result"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+class BackgroundFit:
+    """One UMAP fit job on the shared worker"""
+
+    def __init__(self, worker, fit_key, fit_kwargs):
+        self.fit_key = fit_key
+        self.state = 'running'
+        self.fraction = 0.0
+        self.message = "Waiting for the fit worker"
+        self._worker = worker
+        self._job_id, self._queue = worker.submit(fit_kwargs)
+
+    def poll(self):
+        """Drain progress messages; returns (state, fraction, message)"""
+        while self.state == 'running':
+            try:
+                state, fraction, message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if state == 'progress':
+                self.fraction, self.message = fraction, message
+            else:
+                self.state, self.fraction, self.message = state, fraction, message
+                self._worker.finish(self._job_id)
+        return self.state, self.fraction, self.message
+
+    def cancel(self):
+        """Cancel the job if it is still queued or running"""
+        if self.state == 'running':
+            self._worker.cancel(self._job_id)
+        self.state = 'cancelled'
+
+
+class FitScheduler:
+    """Keeps at most one background fit per session, cancelling superseded ones"""
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.current = None
+
+    def request(self, fit_key, fit_kwargs):
+        """Return the fit for `fit_key`, starting it (and cancelling any other fit) if needed"""
+        if self.current is not None and self.current.fit_key == fit_key and self.current.state != 'cancelled':
+            return self.current
+
+        if self.current is not None:
+            self.current.cancel()
+        self.current = BackgroundFit(self.worker, fit_key, fit_kwargs)
+        return self.current
+
+    def cancel(self):
+        if self.current is not None:
+            self.current.cancel()
+            self.current = None
+
+
+if __name__ == "__main__":
+    _worker_main()
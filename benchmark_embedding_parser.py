@@ -0,0 +1,93 @@
+import ast
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import parse_embedding_column
+
+## Benchmark the bulk embedding parser against the original per-row ast.literal_eval loop
+## Using command:
+## python benchmark_embedding_parser.py [embeddings_csv_file] [--rows N]
+##
+## Rows are repeated from the file (or generated at random if no file is given) until there are
+## N of them, so sizes like the 21k-50k tweets allowed by the Streamlit slider can be tested.
+
+
+def legacy_parse(df):
+    """The per-row loop load_base_tweets_and_fit_umap used before parse_embedding_column"""
+    base_embeddings = []
+    base_indices = []
+
+    for i, embedding_str in enumerate(df['embedding']):
+        tweet_id = str(df.iloc[i].iloc[0]) if pd.notna(df.iloc[i].iloc[0]) else ""
+        if tweet_id.startswith('999'):
+            continue
+
+        try:
+            if pd.notna(embedding_str) and embedding_str != 'nan':
+                embedding = ast.literal_eval(embedding_str)
+                base_embeddings.append(embedding)
+                base_indices.append(i)
+        except:
+            continue
+
+    return np.array(base_embeddings), base_indices
+
+
+def bulk_parse(df):
+    """Same result using parse_embedding_column and a vectorized test-tweet mask"""
+    embeddings, valid = parse_embedding_column(df['embedding'])
+    valid &= ~df.iloc[:, 0].str.startswith('999', na=False).to_numpy()
+    return embeddings[valid], np.flatnonzero(valid).tolist()
+
+
+def build_frame(embeddings_file, rows):
+    """Load (or synthesize) an embeddings DataFrame with exactly `rows` rows"""
+    if embeddings_file:
+        df = pd.read_csv(embeddings_file, dtype=str)
+    else:
+        rng = np.random.default_rng(42)
+        vectors = rng.standard_normal((1000, 768))
+        df = pd.DataFrame({
+            'id': [str(i) for i in range(1000)],
+            'embedding': [str(vector.tolist()) for vector in vectors]
+        })
+
+    repeats = -(-rows // len(df))
+    return pd.concat([df] * repeats, ignore_index=True).iloc[:rows]
+
+
+def benchmark():
+    args = sys.argv[1:]
+    rows = 21000
+    if '--rows' in args:
+        position = args.index('--rows')
+        rows = int(args[position + 1])
+        del args[position:position + 2]
+    embeddings_file = args[0] if args else None
+
+    df = build_frame(embeddings_file, rows)
+    print("=== Embedding Parser Benchmark ===")
+    print(f"Source: {embeddings_file or 'random 768-d vectors'}")
+    print(f"Rows: {len(df):,}")
+
+    start = time.perf_counter()
+    legacy_embeddings, legacy_indices = legacy_parse(df)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk_embeddings, bulk_indices = bulk_parse(df)
+    bulk_time = time.perf_counter() - start
+
+    same = legacy_indices == bulk_indices and np.allclose(legacy_embeddings, bulk_embeddings, atol=1e-6)
+
+    print(f"  ast.literal_eval loop:  {legacy_time:8.2f} s")
+    print(f"  parse_embedding_column: {bulk_time:8.2f} s")
+    print(f"  Speedup: {legacy_time / bulk_time:.1f}x")
+    print(f"  Results match: {'✅' if same else '❌'}")
+
+
+if __name__ == "__main__":
+    benchmark()
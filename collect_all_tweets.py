@@ -1,9 +1,19 @@
 import requests
 import json
 import csv
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import re
 import os
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+from embedding_checkpoint import commit_output, truncate_output, write_json_atomic
+from tweet_pages import RETWEET_FILTER, TWEET_KEY_COLUMN, iter_tweet_pages
+from tweet_sync_state import high_water_marks, load_sync_state, record_completed_run
 
 ###############################################################################################
 # collect_all_tweets.py
@@ -11,8 +21,36 @@ import os
 # to a CSV file with checkpointing support.
 # It handles resuming from previous checkpoints, filtering out low-quality tweets, and writing
 # tweets incrementally to avoid memory issues.
+#
+# Several users are fetched in parallel (--workers) over one pooled keep-alive session, with all
+# workers together kept under --max-rps requests per second. Worker threads hand their kept
+# tweets to a single CsvCheckpointWriter, which appends them and updates the checkpoint (including
+# the progress of every user still in flight) under one lock.
+#
+# Tweets are paged by tweet_id (keyset pagination, see tweet_pages.py). The checkpoint stores the
+# last tweet_id each in-flight user was written up to, and a resumed run continues from there.
+# It also stores the CSV byte offset those rows end at (flushed to disk first); a resumed run
+# truncates the CSV back to it, so rows written after the last checkpoint are not duplicated.
+# Checkpoints are replaced atomically (temp file + rename), so a crash never corrupts one.
+# --fresh ignores any checkpoint and starts a new CSV file.
+#
+# --fetch lean requests only the columns written to the CSV (PostgREST select=) and lets the
+# server drop retweets; the remaining filters still run locally and are counted on their own.
+#
+# Every completed run records each account's newest tweet_id in tweet_sync_state.json. --sync
+# then fetches only tweets newer than that and appends them to the same CSV instead of pulling
+# every account's full history into a new file (see tweet_sync_state.py).
+#
+# Usage: python collect_all_tweets.py [--workers N] [--max-rps R] [--fetch full|lean] [--sync] [--fresh]
 ###############################################################################################
-def collect_user_tweets():
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_REQUESTS_PER_SECOND = 5.0
+FETCH_MODES = ('full', 'lean')
+
+
+def collect_user_tweets(workers=DEFAULT_WORKERS, max_requests_per_second=DEFAULT_MAX_REQUESTS_PER_SECOND,
+                        fetch_mode='full', sync=False, fresh=False):
     """
     Collects tweets from target users and saves to CSV with checkpointing
     """
@@ -28,33 +66,64 @@ def collect_user_tweets():
     print("=== Collecting Tweet Data with Checkpointing ===")
 
     # Check for existing checkpoint files
-    checkpoint_data, checkpoint_filename = find_existing_checkpoint()
+    checkpoint_data, checkpoint_filename = (None, None) if fresh else find_existing_checkpoint()
+    sync_state = load_sync_state()
+
+    if checkpoint_data and 'in_progress_users' not in checkpoint_data:
+        # Written before in-flight users were tracked by tweet_id and the CSV's committed size was recorded
+        if checkpoint_data.get('current_user'):
+            print(f"❌ Checkpoint {checkpoint_filename} is from an older version of this script and stopped "
+                  f"while collecting {checkpoint_data['current_user']}.")
+            print(f"   Its rows in {checkpoint_data['csv_filename']} can't be matched to a resume point, so "
+                  f"resuming would append duplicates.")
+            print("   Rerun with --fresh to start a new collection (and delete the old checkpoint once done with it).")
+            return
+        print(f"⚠️ Checkpoint {checkpoint_filename} is from an older version of this script; resuming after its "
+              f"completed users without truncating {checkpoint_data['csv_filename']}")
 
     if checkpoint_data:
         print(f"📁 Resuming from checkpoint: {checkpoint_filename}")
-        print(f"   Last completed user: {checkpoint_data.get('current_user', 'None')}")
+        print(f"   Users in progress: {', '.join(checkpoint_data.get('in_progress_users', {})) or 'None'}")
         print(f"   Total tweets collected so far: {checkpoint_data.get('total_tweets_collected', 0)}")
         print(f"   Completed users: {len(checkpoint_data.get('completed_users', []))}")
         csv_filename = checkpoint_data['csv_filename']
+        # Keep the rows of one file consistent: a resumed run fetches the way the run it resumes did
+        fetch_mode = checkpoint_data.get('fetch_mode', 'full')
+        sync = checkpoint_data.get('sync', False)
     else:
-        print("🆕 Starting fresh collection...")
-        # Create filenames with timestamp ONLY for new collections
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        csv_filename = f"tweets_data_filtered_{timestamp}.csv"
         checkpoint_filename = f"checkpoint_{timestamp}.json"
-        
+
+        if sync and sync_state and os.path.exists(sync_state['csv_filename']):
+            csv_filename = sync_state['csv_filename']
+            fetch_mode = sync_state.get('fetch_mode', fetch_mode)
+            print(f"🔄 Syncing new tweets into {csv_filename}...")
+        else:
+            if sync:
+                print("⚠️ No previous collection to sync, collecting everything first")
+                sync = False
+            print("🆕 Starting fresh collection...")
+            # Create filenames with timestamp ONLY for new collections
+            csv_filename = f"tweets_data_filtered_{timestamp}.csv"
+
         checkpoint_data = {
             'csv_filename': csv_filename,
             'completed_users': [],
-            'current_user': None,
-            'current_offset': 0,
+            'in_progress_users': {},
+            'last_keys': {},
             'total_tweets_collected': 0,
             'total_tweets_filtered': 0,
+            'fetch_mode': fetch_mode,
+            'sync': sync,
             'start_time': datetime.now().isoformat()
         }
 
+    # One pooled keep-alive session and one politeness limit shared by every request
+    session = create_session(headers, workers)
+    rate_limiter = RateLimiter(max_requests_per_second)
+
     # Get all account IDs
-    user_accounts = get_all_account_ids(base_url, headers)
+    user_accounts = get_all_account_ids(session, base_url, rate_limiter)
 
     # Filter out already completed users
     remaining_users = {k: v for k, v in user_accounts.items()
@@ -63,18 +132,32 @@ def collect_user_tweets():
     print(f"👥 Total users: {len(user_accounts)}")
     print(f"✅ Completed users: {len(checkpoint_data.get('completed_users', []))}")
     print(f"⏳ Remaining users: {len(remaining_users)}")
+    print(f"⚙️ {workers} users in parallel, at most {max_requests_per_second or 'unlimited'} requests/second, "
+          f"{fetch_mode} fetch mode")
 
-    # Initialize CSV file if starting fresh
-    if not checkpoint_data.get('completed_users'):
+    # Initialize CSV file if starting fresh (a resumed run may have written rows for users still in progress)
+    if not sync and not checkpoint_data.get('completed_users') and not checkpoint_data.get('in_progress_users'):
         initialize_csv_file(csv_filename)
 
+    # A sync starts every account after its high-water mark
+    start_keys = high_water_marks(sync_state) if sync else {}
+
     # Collect tweets with checkpointing
-    collect_tweets_with_checkpoints(
-        base_url, headers, remaining_users,
-        csv_filename, checkpoint_filename, checkpoint_data
-    )
+    try:
+        collect_tweets_with_checkpoints(
+            session, base_url, remaining_users,
+            csv_filename, checkpoint_filename, checkpoint_data,
+            workers, rate_limiter, fetch_mode, start_keys
+        )
+    finally:
+        session.close()
+
+    # Remember every account's newest tweet_id for the next --sync
+    record_completed_run(csv_filename, fetch_mode, checkpoint_data.get('last_keys', {}), incremental=sync)
 
     print(f"\n=== Collection Complete ===")
+    if sync:
+        print(f"🔄 Appended {checkpoint_data['total_tweets_collected']} new tweets to {csv_filename}")
     # Clean up checkpoint file when done
     if os.path.exists(checkpoint_filename):
         os.remove(checkpoint_filename)
@@ -118,10 +201,9 @@ def load_checkpoint(checkpoint_filename):
 # Save checkpoint data to file
 #################################################################################################
 def save_checkpoint(checkpoint_filename, checkpoint_data):
-    """Save current progress to checkpoint file"""
+    """Save current progress to checkpoint file (atomically, so a crash never leaves a corrupt one)"""
     checkpoint_data['last_updated'] = datetime.now().isoformat()
-    with open(checkpoint_filename, 'w') as f:
-        json.dump(checkpoint_data, f, indent=2)
+    write_json_atomic(checkpoint_filename, checkpoint_data)
 
 ##################################################################################################
 # Initialize CSV file with headers
@@ -141,28 +223,156 @@ def initialize_csv_file(csv_filename):
     print(f"📄 Initialized CSV file: {csv_filename}")
 
 ##################################################################################################
-# Append tweets to existing CSV file
+# Single writer for the CSV file and the checkpoint
 ##################################################################################################
-def append_tweets_to_csv(tweets, csv_filename):
-    """Append tweets to existing CSV file"""
-    if not tweets:
-        return
-
-    # Get existing fieldnames from CSV
-    with open(csv_filename, 'r', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        fieldnames = next(reader)  # Read header row
-
-    # Append tweets
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writerows(tweets)
+class CsvCheckpointWriter:
+    """
+    Owns the output CSV while users are collected in parallel. Every append, and the checkpoint
+    update that records it, happens under one lock, so rows never interleave mid-write and the
+    checkpoint always describes what is on disk. in_progress_users maps each user still being
+    fetched to the last tweet_id its written tweets cover (None before the first write);
+    last_keys maps each completed user to the newest tweet_id fetched; output_bytes is the CSV
+    size those rows end at (flushed to disk before the checkpoint is saved).
+    """
+
+    def __init__(self, csv_filename, checkpoint_filename, checkpoint_data):
+        # Get existing fieldnames from CSV
+        with open(csv_filename, 'r', encoding='utf-8') as csvfile:
+            fieldnames = next(csv.reader(csvfile))
+
+        # Rows written after the last checkpoint (possibly a partial one) are fetched again
+        # on resume, so drop them instead of appending duplicates
+        output_bytes = checkpoint_data.get('output_bytes')
+        if output_bytes is not None and os.path.getsize(csv_filename) > output_bytes:
+            print(f"✂️ Dropping {os.path.getsize(csv_filename) - output_bytes} bytes written after the last checkpoint")
+            truncate_output(csv_filename, output_bytes)
+
+        self.csvfile = open(csv_filename, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.csvfile, fieldnames=fieldnames, extrasaction='ignore')
+        self.checkpoint_filename = checkpoint_filename
+        self.checkpoint_data = checkpoint_data
+        self.checkpoint_data.setdefault('in_progress_users', {})
+        self.checkpoint_data.setdefault('last_keys', {})
+        self.checkpoint_data['output_bytes'] = commit_output(self.csvfile)
+        self.lock = threading.Lock()
+
+    def start_user(self, username, after_key=None):
+        with self.lock:
+            self.checkpoint_data['in_progress_users'][username] = after_key
+            save_checkpoint(self.checkpoint_filename, self.checkpoint_data)
+
+    def append(self, username, tweets, filtered_count, last_key):
+        """Append a user's kept tweets, counting `filtered_count` dropped ones, fetched up to `last_key`"""
+        with self.lock:
+            self._write(tweets, filtered_count)
+            self.checkpoint_data['in_progress_users'][username] = last_key
+            save_checkpoint(self.checkpoint_filename, self.checkpoint_data)
+
+    def finish_user(self, username, tweets, filtered_count, last_key):
+        """Append a user's last tweets and mark the user completed, fetched up to `last_key`"""
+        with self.lock:
+            self._write(tweets, filtered_count)
+            self.checkpoint_data['in_progress_users'].pop(username, None)
+            self.checkpoint_data['last_keys'][username] = last_key
+            self.checkpoint_data['completed_users'].append(username)
+            save_checkpoint(self.checkpoint_filename, self.checkpoint_data)
+
+    def _write(self, tweets, filtered_count):
+        self.writer.writerows(tweets)
+        self.checkpoint_data['output_bytes'] = commit_output(self.csvfile)
+        self.checkpoint_data['total_tweets_collected'] += len(tweets)
+        self.checkpoint_data['total_tweets_filtered'] += filtered_count
+
+    def close(self):
+        self.csvfile.close()
+
+##################################################################################################
+# Pooled HTTP session and politeness limit shared by the worker threads
+##################################################################################################
+def create_session(headers, workers):
+    """Keep-alive session with a connection pool large enough for every worker"""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter:
+    """Spaces requests from all threads at least 1 / max_requests_per_second apart (0 = no limit)"""
+
+    def __init__(self, max_requests_per_second):
+        self.interval = 1.0 / max_requests_per_second if max_requests_per_second > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Wait after a 429 answer without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+
+
+def retry_after_seconds(value, default=DEFAULT_RETRY_AFTER):
+    """Seconds to wait for a Retry-After header, given as seconds or as an HTTP date"""
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_with_retry(session, url, rate_limiter, retries=5):
+    """GET within the rate limit, waiting out 429 (too many requests) answers"""
+    for _ in range(retries):
+        rate_limiter.wait()
+        response = session.get(url, timeout=60)
+        if response.status_code != 429:
+            return response
+        time.sleep(retry_after_seconds(response.headers.get('Retry-After')))
+    return response
+
+# Columns the collector adds itself rather than fetching
+LOCAL_COLUMNS = ('username', 'collected_at')
+
+
+def fetch_options(fetch_mode, fieldnames):
+    """
+    iter_tweet_pages keyword arguments for a fetch mode: none for 'full'; for 'lean', a select=
+    list of the CSV columns plus the pagination key, and the server-side retweet filter
+    """
+    if fetch_mode != 'lean':
+        return {}
+
+    columns = [TWEET_KEY_COLUMN]
+    for name in fieldnames:
+        if name in LOCAL_COLUMNS or name == TWEET_KEY_COLUMN:
+            continue
+        # The archive's tweets table has no id column; fill the CSV's id column with the tweet_id
+        columns.append(f"id:{TWEET_KEY_COLUMN}" if name == 'id' else name)
+    return {'select': ','.join(columns), 'filters': [RETWEET_FILTER]}
 
 ##################################################################################################
 # Get all account IDs from the database
 ##################################################################################################
-def get_all_account_ids(base_url, headers):
-    """Get ALL account IDs from the database"""
+def get_all_account_ids(session, base_url, rate_limiter=None):
+    """Get ALL account IDs from the database (within the rate limit, waiting out 429 answers)"""
+    rate_limiter = rate_limiter or RateLimiter(0)
     user_accounts = {}
     print("\n1. Getting all account IDs...")
 
@@ -170,7 +380,7 @@ def get_all_account_ids(base_url, headers):
     offset = 0
 
     while True:
-        response = requests.get(f"{base_url}/account?limit={limit}&offset={offset}", headers=headers)
+        response = get_with_retry(session, f"{base_url}/account?limit={limit}&offset={offset}", rate_limiter)
         if response.status_code == 200:
             accounts = response.json()
             if not accounts:
@@ -238,94 +448,118 @@ def should_filter_tweet(tweet_text):
 ##################################################################################################
 # Function to collect tweets with checkpoints
 ##################################################################################################
-def collect_tweets_with_checkpoints(base_url, headers, user_accounts, csv_filename, checkpoint_filename,
-                                    checkpoint_data):
-    """Collect tweets from all users with checkpointing and incremental CSV writing"""
+def collect_tweets_with_checkpoints(session, base_url, user_accounts, csv_filename, checkpoint_filename,
+                                    checkpoint_data, workers=DEFAULT_WORKERS, rate_limiter=None, fetch_mode='full',
+                                    start_keys=None):
+    """Collect tweets from all users, `workers` users at a time, with checkpointing and incremental CSV writing"""
 
     print("\n2. Collecting tweets with checkpointing...")
 
-    for username, account_id in user_accounts.items():
+    rate_limiter = rate_limiter or RateLimiter(0)
+    writer = CsvCheckpointWriter(csv_filename, checkpoint_filename, checkpoint_data)
+    options = fetch_options(fetch_mode, writer.writer.fieldnames)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        # Users start after their high-water mark (--sync) or, if they were in flight when the last run
+        # stopped, after their last written tweet
+        resume_keys = {**(start_keys or {}), **checkpoint_data.get('in_progress_users', {})}
+        futures = {executor.submit(collect_single_user, session, base_url, username, account_id,
+                                   rate_limiter, writer, stop, resume_keys.get(username), options): username
+                   for username, account_id in user_accounts.items()}
+        for future in as_completed(futures):
+            username = futures[future]
+            user_tweet_count = future.result()
+            if user_tweet_count is not None:
+                print(f"  ✅ {username}: Kept {user_tweet_count} tweets")
+    finally:
+        # On Ctrl+C (or an error) users in flight stop after their current page and stay in the
+        # checkpoint as in progress; queued users are not started
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+
+    print(f"\n📊 Final Summary:")
+    print(f"  Total tweets collected: {checkpoint_data['total_tweets_collected']}")
+    print(f"  Total tweets filtered locally: {checkpoint_data['total_tweets_filtered']}")
+    if fetch_mode == 'lean':
+        print("  (retweets were dropped by the server and are not counted)")
+
+
+def collect_single_user(session, base_url, username, account_id, rate_limiter, writer, stop, after_key=None,
+                        options=None):
+    """
+    Fetch, filter and write one user's tweets after tweet_id `after_key` (runs in a worker thread).
+    `options` are extra iter_tweet_pages arguments (see fetch_options).
+    Returns the number kept, or None if `stop` was set before the user was done.
+    """
+    if after_key is None:
         print(f"  📥 Processing {username}...")
+    else:
+        print(f"  📥 Resuming {username} after tweet {after_key}...")
+    writer.start_user(username, after_key)
 
-        # Update checkpoint for current user
-        checkpoint_data['current_user'] = username
-        checkpoint_data['current_offset'] = 0
-        save_checkpoint(checkpoint_filename, checkpoint_data)
-
-        limit = 1000
-        offset = 0
-        user_tweets_batch = []
-        user_tweet_count = 0
-        user_filtered_count = 0
-
-        while True:
-            try:
-                response = requests.get(
-                    f"{base_url}/tweets?account_id=eq.{account_id}&limit={limit}&offset={offset}",
-                    headers=headers
-                )
-
-                if response.status_code == 200:
-                    tweets = response.json()
-                    if not tweets:
-                        break
-
-                    # Process tweets in this batch
-                    for tweet in tweets:
-                        tweet_text = tweet.get('full_text', '').strip()
-
-                        # Apply filtering
-                        if should_filter_tweet(tweet_text):
-                            user_filtered_count += 1
-                            continue
-
-                        # Add metadata to tweet
-                        tweet['username'] = username
-                        tweet['collected_at'] = datetime.now().isoformat()
-                        user_tweets_batch.append(tweet)
-                        user_tweet_count += 1
-
-                    # Write batch to CSV every 1000 processed tweets or when done with user
-                    if len(user_tweets_batch) >= 500 or len(tweets) < limit:
-                        append_tweets_to_csv(user_tweets_batch, csv_filename)
-                        checkpoint_data['total_tweets_collected'] += len(user_tweets_batch)
-                        checkpoint_data['total_tweets_filtered'] += user_filtered_count
-                        user_tweets_batch = []  # Clear batch
-                        user_filtered_count = 0  # Reset for next batch
-
-                    offset += limit
-                    checkpoint_data['current_offset'] = offset
-
-                    # Save checkpoint every 5000 tweets processed
-                    if offset % 5000 == 0:
-                        save_checkpoint(checkpoint_filename, checkpoint_data)
-                        print(f"    💾 Checkpoint saved at offset {offset}")
-
-                    print(f"    Processed {offset} tweets | Kept: {user_tweet_count}")
-
-                    if len(tweets) < limit:
-                        break
-
-                else:
-                    print(f"    ❌ Error getting tweets for {username}: {response.status_code}")
-                    break
-
-            except Exception as e:
-                print(f"    ⚠️ Exception for {username}: {e}")
-                break
+    user_tweets_batch = []
+    user_tweet_count = 0
+    user_filtered_count = 0
+    processed_count = 0
+    last_key = after_key
 
-        # Mark user as completed
-        checkpoint_data['completed_users'].append(username)
-        checkpoint_data['current_user'] = None
-        checkpoint_data['current_offset'] = 0
-        save_checkpoint(checkpoint_filename, checkpoint_data)
+    pages = iter_tweet_pages(lambda url: get_with_retry(session, url, rate_limiter),
+                             base_url, account_id, after_key, **(options or {}))
+    try:
+        for tweets, last_key in pages:
+            # Process tweets in this batch
+            for tweet in tweets:
+                tweet_text = tweet.get('full_text', '').strip()
 
-        print(f"  ✅ {username}: Kept {user_tweet_count} tweets")
+                # Apply filtering
+                if should_filter_tweet(tweet_text):
+                    user_filtered_count += 1
+                    continue
 
-    print(f"\n📊 Final Summary:")
-    print(f"  Total tweets collected: {checkpoint_data['total_tweets_collected']}")
-    print(f"  Total tweets filtered: {checkpoint_data['total_tweets_filtered']}")
+                # Add metadata to tweet
+                tweet['username'] = username
+                tweet['collected_at'] = datetime.now().isoformat()
+                user_tweets_batch.append(tweet)
+                user_tweet_count += 1
+
+            processed_count += len(tweets)
+
+            # Write batch to CSV (and checkpoint the page key) every 500 kept tweets
+            if len(user_tweets_batch) >= 500:
+                writer.append(username, user_tweets_batch, user_filtered_count, last_key)
+                user_tweets_batch = []  # Clear batch
+                user_filtered_count = 0  # Reset for next batch
+
+            print(f"    {username}: processed {processed_count} tweets | Kept: {user_tweet_count}")
+
+            # Unwritten tweets are fetched again on resume, from the last checkpointed key
+            if stop.is_set():
+                return None
+
+    except RuntimeError as e:
+        print(f"    ❌ Error getting tweets for {username}: {e}")
+    except Exception as e:
+        print(f"    ⚠️ Exception for {username}: {e}")
+
+    # Write the rest and mark user as completed
+    writer.finish_user(username, user_tweets_batch, user_filtered_count, last_key)
+    return user_tweet_count
 
 
 if __name__ == "__main__":
-    collect_user_tweets()
+    parser = argparse.ArgumentParser(description="Collect and filter tweets of every account in the archive")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Users fetched in parallel (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--max-rps', type=float, default=DEFAULT_MAX_REQUESTS_PER_SECOND,
+                        help=f"Politeness limit in requests per second across all workers, 0 for none "
+                             f"(default: {DEFAULT_MAX_REQUESTS_PER_SECOND})")
+    parser.add_argument('--fetch', choices=FETCH_MODES, default='full',
+                        help="full: every column of every tweet (default); lean: only the CSV's columns, "
+                             "with retweets dropped by the server")
+    parser.add_argument('--sync', action='store_true',
+                        help="Append only tweets newer than the last completed collection to its CSV")
+    parser.add_argument('--fresh', action='store_true', help="Ignore any checkpoint and start a new CSV file")
+    args = parser.parse_args()
+    collect_user_tweets(args.workers, args.max_rps, args.fetch, args.sync, args.fresh)
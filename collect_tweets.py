@@ -3,6 +3,8 @@ import json
 import csv
 from datetime import datetime
 
+from tweet_pages import iter_tweet_pages
+
 
 def collect_user_tweets():
     """
@@ -66,21 +68,12 @@ def collect_all_tweets(base_url, headers, user_accounts):
     for username, account_id in user_accounts.items():
         print(f"  Getting tweets for {username}...")
 
-        limit = 1000  # Get 1000 tweets at a time
-        offset = 0
         user_tweet_count = 0
 
-        while True:
-            response = requests.get(
-                f"{base_url}/tweets?account_id=eq.{account_id}&limit={limit}&offset={offset}",
-                headers=headers
-            )
-
-            if response.status_code == 200:
-                tweets = response.json()
-                if not tweets:
-                    break
-
+        # 1000 tweets at a time, paged by tweet_id (see tweet_pages.py)
+        try:
+            for tweets, _ in iter_tweet_pages(lambda url: requests.get(url, headers=headers),
+                                              base_url, account_id):
                 # Add username and collection timestamp to each tweet
                 for tweet in tweets:
                     tweet['username'] = username
@@ -88,17 +81,10 @@ def collect_all_tweets(base_url, headers, user_accounts):
                     all_tweets.append(tweet)
 
                 user_tweet_count += len(tweets)
-                offset += limit
 
                 print(f"    Collected {user_tweet_count} tweets so far...")
-
-                # Stop if we got less than the limit (reached the end)
-                if len(tweets) < limit:
-                    break
-
-            else:
-                print(f"    Error getting tweets for {username}: {response.status_code}")
-                break
+        except RuntimeError as e:
+            print(f"    Error getting tweets for {username}: {e}")
 
         print(f"  ✓ Total for {username}: {user_tweet_count} tweets")
 
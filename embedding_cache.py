@@ -0,0 +1,266 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+
+###############################################################################################
+# embedding_cache.py
+# Persistent, content-addressed cache for embeddings. Entries are keyed by model name plus a
+# SHA-256 of the normalized tweet text and stored as compact float32 blobs in SQLite, so re-runs
+# and repeated test tweets only pay LM Studio for texts that have never been embedded.
+# The cache keeps hit/miss counters and evicts least-recently-used entries past max_bytes.
+# QueryEmbeddingCache is a small in-memory LRU in front of it for interactive lookups: it skips
+# SQLite for recently used texts and coalesces concurrent requests for the same text.
+###############################################################################################
+
+DEFAULT_CACHE_FILE = "embedding_cache.sqlite"
+
+
+def normalize_text(text):
+    """Normalize text before hashing so trivial whitespace/unicode differences share an entry"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(model, text):
+    """Content address for a (model, text) pair"""
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache shared by the embedding scripts and the Streamlit app.
+    Safe to use from several threads; each call takes an internal lock.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self.total_bytes = row[0]
+
+    ##################################################################################################
+    # Lookups
+    ##################################################################################################
+    def get(self, model, text):
+        """Return the cached embedding for `text`, or None"""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        """Return a list aligned with `texts` holding cached embeddings (None on miss)"""
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            unique_keys = list(set(keys))
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    ##################################################################################################
+    # Inserts and eviction
+    ##################################################################################################
+    def put(self, model, text, embedding):
+        """Store one embedding"""
+        self.put_many(model, [text], [embedding])
+
+    def put_many(self, model, texts, embeddings):
+        """Store embeddings for texts; None embeddings are skipped"""
+        now = time.time()
+        entries = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            entries[cache_key(model, text)] = array('f', embedding).tobytes()
+
+        if not entries:
+            return
+
+        with self._lock:
+            # Subtract entries we are about to overwrite so total_bytes stays exact
+            keys = list(entries)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                row = self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchone()
+                self.total_bytes -= row[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in entries.items()]
+            )
+            self.total_bytes += sum(len(blob) for blob in entries.values())
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache is back under 90% of max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.total_bytes -= size
+
+    ##################################################################################################
+    # Stats
+    ##################################################################################################
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters and on-disk size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self),
+            'bytes': self.total_bytes,
+            'file_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+
+##################################################################################################
+# In-memory LRU for interactive queries
+##################################################################################################
+class QueryEmbeddingCache:
+    """
+    In-memory LRU of embeddings, optionally backed by an EmbeddingCache.
+    Concurrent lookups of the same (model, text) share one computation: the first caller runs
+    it and the others wait for its result instead of sending their own request.
+    """
+
+    def __init__(self, max_entries=1024, backing=None):
+        self.max_entries = max_entries
+        self.backing = backing
+        self.memory_hits = 0
+        self.backing_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, model, text, compute):
+        """
+        Return the embedding of `text`, calling `compute(text)` on a miss.
+        `compute` may return None (not cached) or raise; waiting callers see the same outcome.
+        """
+        key = cache_key(model, text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = self._in_flight[key] = Future()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            return pending.result()
+
+        try:
+            embedding = self.backing.get(model, text) if self.backing is not None else None
+            with self._lock:
+                if embedding is not None:
+                    self.backing_hits += 1
+                else:
+                    self.misses += 1
+            if embedding is None:
+                embedding = compute(text)
+                if embedding is not None and self.backing is not None:
+                    self.backing.put(model, text, embedding)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            if embedding is not None:
+                self._entries[key] = embedding
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            del self._in_flight[key]
+        pending.set_result(embedding)
+        return embedding
+
+    def stats(self):
+        """Lookup counters and current size"""
+        lookups = self.memory_hits + self.backing_hits + self.misses + self.coalesced
+        return {
+            'memory_hits': self.memory_hits,
+            'backing_hits': self.backing_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+        }
@@ -0,0 +1,69 @@
+import json
+import os
+from datetime import datetime
+
+###############################################################################################
+# embedding_checkpoint.py
+# Row-level checkpoints for the embedding scripts. After each chunk of rows is flushed to the
+# output CSV, the number of input rows consumed and the output byte offset are recorded in
+# <output_file>.checkpoint.json (written atomically via rename). On restart the script reopens
+# the same output file, truncates anything past the committed offset and skips the input rows
+# that are already there instead of starting a new timestamped file.
+###############################################################################################
+
+
+def checkpoint_path(output_file):
+    """Checkpoint file that belongs to an output CSV"""
+    return f"{output_file}.checkpoint.json"
+
+
+def find_embedding_checkpoint(input_file, kind):
+    """
+    Find the most recent checkpoint written by script `kind` for `input_file`.
+    Returns (checkpoint_data, checkpoint_filename) or (None, None).
+    """
+    checkpoint_files = [f for f in os.listdir('.') if f.endswith('.checkpoint.json')]
+
+    for filename in sorted(checkpoint_files, key=os.path.getmtime, reverse=True):
+        try:
+            with open(filename, 'r') as f:
+                checkpoint_data = json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Corrupted checkpoint file: {filename}, ignoring")
+            continue
+
+        if (checkpoint_data.get('kind') == kind
+                and os.path.abspath(checkpoint_data.get('input_file', '')) == os.path.abspath(input_file)
+                and os.path.exists(checkpoint_data.get('output_file', ''))):
+            return checkpoint_data, filename
+
+    return None, None
+
+
+def write_json_atomic(filename, data):
+    """Write JSON so readers see the old or the new file, never a partial one (temp file + rename)"""
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+def save_embedding_checkpoint(checkpoint_filename, checkpoint_data):
+    """Write checkpoint data atomically (temp file + rename)"""
+    checkpoint_data['last_updated'] = datetime.now().isoformat()
+    write_json_atomic(checkpoint_filename, checkpoint_data)
+
+
+def commit_output(outfile):
+    """Flush the output CSV to disk and return the committed byte offset"""
+    outfile.flush()
+    os.fsync(outfile.fileno())
+    return outfile.tell()
+
+
+def truncate_output(output_file, output_bytes):
+    """Drop any partially written rows past the last committed byte offset"""
+    with open(output_file, 'r+b') as f:
+        f.truncate(output_bytes)
@@ -0,0 +1,207 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from embedding_cache import normalize_text
+
+###############################################################################################
+# embedding_client.py
+# Shared client for the LM Studio /v1/embeddings endpoint used by the embedding scripts.
+# Packs many tweets into each request (the OpenAI-style "input" field takes a list), adapts the
+# batch size to observed latency and payload size, and splits failing batches in half so one
+# bad tweet only loses itself. EmbeddingEngine keeps several batches in flight at once over a
+# pooled keep-alive session and, when given an EmbeddingCache, only sends texts it has not seen.
+# Results always come back in input order.
+###############################################################################################
+
+EMBEDDING_MODEL = "text-embedding-nomic-embed-text-v1.5"
+
+
+##################################################################################################
+# Adaptive batch sizing
+##################################################################################################
+class AdaptiveBatchSizer:
+    """
+    Picks how many texts go into the next request.
+    Grows the batch while requests come back fast, shrinks it when they are slow or fail,
+    and never lets a single request body exceed max_payload_bytes.
+    """
+
+    def __init__(self, initial_size=32, min_size=1, max_size=256,
+                 target_latency=2.0, max_payload_bytes=1_000_000):
+        self.batch_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self._lock = threading.Lock()
+
+    def take(self, texts, start):
+        """Return the end index of the next batch starting at `start`"""
+        end = start
+        payload_bytes = 0
+        batch_size = self.batch_size
+        while end < len(texts) and end - start < batch_size:
+            text_bytes = len(texts[end].encode('utf-8'))
+            # Always take at least one text, even if it alone is over the limit
+            if end > start and payload_bytes + text_bytes > self.max_payload_bytes:
+                break
+            payload_bytes += text_bytes
+            end += 1
+        return end
+
+    def record(self, batch_size, latency, success):
+        """Update the batch size from the outcome of one request"""
+        with self._lock:
+            self._record(batch_size, latency, success)
+
+    def _record(self, batch_size, latency, success):
+        if not success:
+            self.batch_size = max(self.min_size, self.batch_size // 2)
+        elif latency > self.target_latency * 1.5:
+            self.batch_size = max(self.min_size, int(self.batch_size * 0.75))
+        elif latency < self.target_latency * 0.5 and batch_size >= self.batch_size:
+            # Only grow when the batch we just sent was actually full
+            self.batch_size = min(self.max_size, self.batch_size * 2)
+
+
+##################################################################################################
+# Single request for a list of texts
+##################################################################################################
+def get_embeddings_batch(texts, url, session=None, timeout=60):
+    """
+    Get embeddings for a list of texts in one request.
+    Returns a list of embeddings in input order, or None if the request failed.
+    """
+    http = session or requests
+    try:
+        response = http.post(url,
+                             json={
+                                 "model": EMBEDDING_MODEL,
+                                 "input": list(texts)
+                             },
+                             timeout=timeout
+                             )
+
+        if response.status_code != 200:
+            return None
+
+        items = response.json()['data']
+        if len(items) != len(texts):
+            return None
+
+        # The API reports each item's position; don't rely on response order
+        items = sorted(items, key=lambda item: item.get('index', 0))
+        return [item['embedding'] for item in items]
+
+    except Exception:
+        return None
+
+
+def embed_with_split(texts, url, sizer=None, session=None):
+    """
+    Embed a batch, splitting it in half on failure until single texts remain.
+    Returns a list aligned with `texts`; texts that fail on their own get None.
+    """
+    start_time = time.time()
+    embeddings = get_embeddings_batch(texts, url, session=session)
+    if sizer is not None:
+        sizer.record(len(texts), time.time() - start_time, embeddings is not None)
+
+    if embeddings is not None:
+        return embeddings
+    if len(texts) == 1:
+        return [None]
+
+    middle = len(texts) // 2
+    return (embed_with_split(texts[:middle], url, sizer, session) +
+            embed_with_split(texts[middle:], url, sizer, session))
+
+
+##################################################################################################
+# Concurrent embedding engine
+##################################################################################################
+class EmbeddingEngine:
+    """
+    Embeds texts with up to `concurrency` requests in flight over one pooled keep-alive session.
+    Shared by generate_embeddings.py and generate_embeddings_filtered.py.
+    """
+
+    def __init__(self, url, concurrency=4, batched=True, cache=None):
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        if batched:
+            self.sizer = AdaptiveBatchSizer()
+        else:
+            self.sizer = AdaptiveBatchSizer(initial_size=1, max_size=1)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    def embed_texts(self, texts):
+        """
+        Embed every text in `texts`, keeping at most `concurrency` batches in flight.
+        Cached texts are served from the cache and duplicates are only sent once.
+        Returns a list aligned with `texts` (None where embedding failed).
+        """
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        results = self.cache.get_many(EMBEDDING_MODEL, texts)
+
+        # One request slot per distinct normalized text that missed the cache
+        missing = {}
+        for i, text in enumerate(texts):
+            if results[i] is None:
+                missing.setdefault(normalize_text(text), []).append(i)
+        if not missing:
+            return results
+
+        unique_texts = [texts[positions[0]] for positions in missing.values()]
+        embeddings = self._embed_uncached(unique_texts)
+        self.cache.put_many(EMBEDDING_MODEL, unique_texts, embeddings)
+
+        for positions, embedding in zip(missing.values(), embeddings):
+            for i in positions:
+                results[i] = embedding
+        return results
+
+    def _embed_uncached(self, texts):
+        results = [None] * len(texts)
+        pending = {}
+        start = 0
+
+        while start < len(texts) or pending:
+            # Top up the window; batch sizes are picked as we go so the sizer can adapt
+            while start < len(texts) and len(pending) < self.concurrency:
+                end = self.sizer.take(texts, start)
+                future = self.executor.submit(embed_with_split, texts[start:end], self.url,
+                                              self.sizer, self.session)
+                pending[future] = start
+                start = end
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_start = pending.pop(future)
+                embeddings = future.result()
+                results[batch_start:batch_start + len(embeddings)] = embeddings
+
+        return results
+
+    def close(self):
+        """Stop the worker threads and close pooled connections"""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
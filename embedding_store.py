@@ -0,0 +1,364 @@
+import csv
+import json
+import os
+import tempfile
+import warnings
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from embedding_checkpoint import commit_output, truncate_output
+
+###############################################################################################
+# embedding_store.py
+# Output writers for the embedding scripts and the matching reader for the Streamlit app.
+# "csv" keeps the original format (embedding as a JSON string column). "npy" writes every vector
+# to one contiguous float32 .npy file and the remaining columns to a small <name>.meta.csv whose
+# embedding_row column is the vector's row in the .npy file (empty when a tweet has no vector).
+# A 768-d vector takes 3 KB in the .npy file instead of ~15 KB of text, and loads without parsing.
+# parse_embedding_column bulk-parses the JSON column of existing CSV files into one float32 matrix.
+# load_tweet_dataset spills that matrix to a <name>.vectors.npy sidecar the first time, so the CSV's
+# vectors are memory-mapped read-only like a binary store's: processes (the app and background
+# fits) share one copy through the OS page cache instead of each parsing its own. A small
+# <name>.vectors.json, written last, records the size and mtime (ns) of the CSV the sidecar was
+# parsed from; the sidecar is only used while both still match exactly.
+###############################################################################################
+
+OUTPUT_FORMATS = ('csv', 'npy')
+
+# Fixed-size .npy header so it can be rewritten in place as vectors are appended
+NPY_HEADER_BYTES = 128
+
+
+def npy_path_for(meta_file):
+    """Path of the .npy vector file that belongs to a .meta.csv file"""
+    return meta_file[:-len('.meta.csv')] + '.npy'
+
+
+def is_embedding_store(embeddings_file):
+    """True if `embeddings_file` is the metadata table of a binary embedding store"""
+    return embeddings_file.endswith('.meta.csv') and os.path.exists(npy_path_for(embeddings_file))
+
+
+def output_file_for(output_prefix, output_format):
+    """Main output file name for a format (the .meta.csv for binary stores)"""
+    return f"{output_prefix}.meta.csv" if output_format == 'npy' else f"{output_prefix}.csv"
+
+
+def npy_header(rows, dim):
+    """Version 1.0 .npy header for a (rows, dim) float32 array, padded to NPY_HEADER_BYTES"""
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, dim)
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+##################################################################################################
+# Writers
+##################################################################################################
+class CsvEmbeddingWriter:
+    """Writes rows with the embedding as a JSON string in an 'embedding' column"""
+
+    def __init__(self, output_file, fieldnames, checkpoint_data):
+        resuming = checkpoint_data['output_bytes'] > 0
+        if resuming:
+            # Anything written after the last checkpoint may be a partial chunk
+            truncate_output(output_file, checkpoint_data['output_bytes'])
+
+        self.file = open(output_file, 'a' if resuming else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames + ['embedding'])
+        if not resuming:
+            self.writer.writeheader()
+
+    def writerows(self, rows):
+        """Write rows whose 'embedding' is a list of floats or None"""
+        for row in rows:
+            row['embedding'] = json.dumps(row['embedding']) if row['embedding'] else ''
+        self.writer.writerows(rows)
+
+    def commit(self, checkpoint_data):
+        """Flush to disk and record the committed position in the checkpoint"""
+        checkpoint_data['output_bytes'] = commit_output(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryEmbeddingWriter:
+    """Writes vectors to a float32 .npy file and the other columns to a .meta.csv table"""
+
+    def __init__(self, output_file, fieldnames, checkpoint_data):
+        self.npy_file = npy_path_for(output_file)
+        self.vector_count = checkpoint_data.get('vectors_written', 0)
+        self.dim = checkpoint_data.get('embedding_dim')
+        resuming = checkpoint_data['output_bytes'] > 0
+
+        if resuming:
+            truncate_output(output_file, checkpoint_data['output_bytes'])
+            truncate_output(self.npy_file, NPY_HEADER_BYTES + self.vector_count * (self.dim or 0) * 4)
+            self.vectors = open(self.npy_file, 'r+b')
+            self.vectors.seek(0, os.SEEK_END)
+        else:
+            self.vectors = open(self.npy_file, 'w+b')
+            self.vectors.write(npy_header(0, 0))
+
+        self.meta = open(output_file, 'a' if resuming else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.meta, fieldnames=fieldnames + ['embedding_row'])
+        if not resuming:
+            self.writer.writeheader()
+
+    def writerows(self, rows):
+        """Write rows whose 'embedding' is a list of floats or None"""
+        for row in rows:
+            embedding = row.pop('embedding')
+            if self.dim is None and embedding:
+                self.dim = len(embedding)
+
+            if embedding and len(embedding) == self.dim:
+                self.vectors.write(array('f', embedding).tobytes())
+                row['embedding_row'] = self.vector_count
+                self.vector_count += 1
+            else:
+                row['embedding_row'] = ''
+        self.writer.writerows(rows)
+
+    def commit(self, checkpoint_data):
+        """Rewrite the .npy header for the current row count, flush both files to disk"""
+        self.vectors.seek(0)
+        self.vectors.write(npy_header(self.vector_count, self.dim or 0))
+        self.vectors.seek(0, os.SEEK_END)
+        commit_output(self.vectors)
+
+        checkpoint_data['output_bytes'] = commit_output(self.meta)
+        checkpoint_data['vectors_written'] = self.vector_count
+        checkpoint_data['embedding_dim'] = self.dim
+
+    def close(self):
+        self.vectors.close()
+        self.meta.close()
+
+
+def open_embedding_writer(output_format, output_file, fieldnames, checkpoint_data):
+    """Open the writer for `output_format` ('csv' or 'npy')"""
+    if output_format == 'npy':
+        return BinaryEmbeddingWriter(output_file, fieldnames, checkpoint_data)
+    return CsvEmbeddingWriter(output_file, fieldnames, checkpoint_data)
+
+
+##################################################################################################
+# Reader
+##################################################################################################
+def load_embedding_store(meta_file, columns=None):
+    """
+    Load a binary embedding store, reading only `columns` of the metadata if given.
+    Returns (metadata DataFrame with an integer embedding_row column, -1 where missing,
+    read-only memory-mapped (N, dim) float32 matrix).
+    """
+    if columns is None:
+        df = pd.read_csv(meta_file, dtype=str)
+    else:
+        df = _read_projected_csv(meta_file, columns)
+    df['embedding_row'] = pd.to_numeric(df['embedding_row'], errors='coerce').fillna(-1).astype(np.int64)
+    embeddings = np.load(npy_path_for(meta_file), mmap_mode='r')
+    return df, embeddings
+
+
+##################################################################################################
+# Bulk parser for the JSON embedding column of existing CSV files
+##################################################################################################
+def _parse_floats(text):
+    """Parse comma-separated floats; None if any element is not a number"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float32, sep=',')
+        except (ValueError, DeprecationWarning):
+            return None
+
+
+def parse_embedding_column(values, dim=None, chunk_rows=4096):
+    """
+    Parse a column of "[x, y, ...]" embedding strings into one preallocated (N, dim) float32 matrix.
+    Rows that are missing, malformed or have the wrong length are flagged in the returned validity
+    mask (and left as zeros) instead of raising. `dim` defaults to the most common length.
+    Returns (matrix, valid_mask).
+    """
+    # Plain str methods run at C speed per row and avoid copying the column through pandas
+    texts = [value.strip() if isinstance(value, str) else '' for value in values]
+    well_formed = np.fromiter((text[:1] == '[' and text[-1:] == ']' for text in texts),
+                              dtype=bool, count=len(texts))
+    comma_counts = np.fromiter((text.count(',') for text in texts), dtype=np.int64, count=len(texts))
+
+    if dim is None:
+        if not well_formed.any():
+            return np.zeros((len(texts), 0), dtype=np.float32), np.zeros(len(texts), dtype=bool)
+        dim = int(np.bincount(comma_counts[well_formed]).argmax()) + 1
+
+    valid = well_formed & (comma_counts == dim - 1)
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    rows = np.flatnonzero(valid)
+
+    # One np.fromstring call per chunk of rows; the comma count already guarantees each row's length
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        flat = _parse_floats(','.join(texts[row][1:-1] for row in chunk))
+        if flat is not None and flat.size == len(chunk) * dim:
+            matrix[chunk] = flat.reshape(len(chunk), dim)
+            continue
+
+        # Something in this chunk is not a number; parse it row by row to find the culprits
+        for row in chunk:
+            vector = _parse_floats(texts[row][1:-1])
+            if vector is not None and vector.size == dim:
+                matrix[row] = vector
+            else:
+                valid[row] = False
+
+    return matrix, valid
+
+
+##################################################################################################
+# Dataset loader shared by layout fitting and rendering
+##################################################################################################
+# Columns the Streamlit app uses besides the first one (the tweet ID, also used to spot test tweets)
+DATASET_COLUMNS = ('id', 'tweet_id', 'username', 'full_text', 'embedding', 'embedding_row')
+
+
+def _read_projected_csv(path, columns):
+    """Read only `columns` (plus the first column) of a CSV file, skipping malformed lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    usecols = [name for i, name in enumerate(header) if i == 0 or name in columns]
+
+    try:
+        return pd.read_csv(path, quotechar='"', on_bad_lines='skip', dtype=str, usecols=usecols)
+    except:
+        try:
+            return pd.read_csv(path, quotechar='"', error_bad_lines=False, warn_bad_lines=False,
+                               dtype=str, usecols=usecols)
+        except:
+            return pd.read_csv(path, sep=',', quotechar='"', on_bad_lines='skip', engine='python',
+                               dtype=str, usecols=usecols)
+
+
+def vectors_sidecar_paths(csv_file):
+    """
+    Paths of the parsed-vector sidecar of a CSV file:
+    (float32 matrix .npy, embedding_row .npy, source stamp .json)
+    """
+    base = csv_file[:-len('.csv')] if csv_file.endswith('.csv') else csv_file
+    return base + '.vectors.npy', base + '.vector_rows.npy', base + '.vectors.json'
+
+
+def _source_stamp(csv_file):
+    """Size and mtime (ns) identifying one version of a file"""
+    file_stat = os.stat(csv_file)
+    return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+
+
+def _vectors_sidecar_is_fresh(csv_file, source_stamp):
+    """True if the sidecar of a CSV file exists and was parsed from the version with `source_stamp`"""
+    try:
+        with open(vectors_sidecar_paths(csv_file)[2], 'r') as f:
+            return json.load(f) == source_stamp
+    except (OSError, ValueError):
+        return False
+
+
+def _load_vectors_sidecar(csv_file, rows):
+    """Memory-mapped (matrix, embedding_row) sidecar of a CSV file of `rows` rows, or None if it doesn't match"""
+    vectors_path, rows_path, _ = vectors_sidecar_paths(csv_file)
+    try:
+        embedding_rows = np.load(rows_path)
+        if len(embedding_rows) != rows:
+            return None
+        return np.load(vectors_path, mmap_mode='r'), embedding_rows
+    except (OSError, ValueError):
+        return None
+
+
+def _save_vectors_sidecar(csv_file, source_stamp, embeddings, embedding_rows):
+    """
+    Write the sidecar (atomically, as other processes may read it) and return the matrix memory-mapped.
+    `source_stamp` is the _source_stamp of the CSV taken before it was read; the stamp file is written
+    last, so a sidecar is never used with a half-written matrix.
+    """
+    vectors_path, rows_path, stamp_path = vectors_sidecar_paths(csv_file)
+    try:
+        for path, write in ((vectors_path, lambda f: np.save(f, embeddings)),
+                            (rows_path, lambda f: np.save(f, embedding_rows)),
+                            (stamp_path, lambda f: f.write(json.dumps(source_stamp).encode('utf-8')))):
+            # A temp file of its own, so processes spilling the same CSV at once don't clobber each other
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    write(f)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        return np.load(vectors_path, mmap_mode='r')
+    except (OSError, ValueError):
+        # Read-only data directory (or an unreadable sidecar): keep the parsed matrix in memory
+        return embeddings
+
+
+def load_tweet_dataset(embeddings_file, spill_vectors=True):
+    """
+    Read an embeddings file (CSV or binary store) once, keeping only DATASET_COLUMNS.
+    Returns (DataFrame, float32 (M, dim) embedding matrix). The DataFrame has an int32 embedding_row
+    column indexing the matrix (-1 where a tweet has no valid vector) in place of the JSON strings;
+    usernames are categorical. The matrix is a read-only memory map for binary stores and, with
+    `spill_vectors`, for CSV files too (through the .vectors.npy sidecar, see the module comment).
+    """
+    if is_embedding_store(embeddings_file):
+        df, embeddings = load_embedding_store(embeddings_file, DATASET_COLUMNS)
+        return _finish_dataset(df, df['embedding_row'].to_numpy()), embeddings
+
+    # Taken before reading, so a CSV that changes while it is parsed never looks fresh afterwards
+    source_stamp = _source_stamp(embeddings_file)
+    sidecar = None
+    if spill_vectors and _vectors_sidecar_is_fresh(embeddings_file, source_stamp):
+        # With an up-to-date sidecar the (large) embedding column need not be read at all
+        df = _read_projected_csv(embeddings_file, [name for name in DATASET_COLUMNS if name != 'embedding'])
+        if _source_stamp(embeddings_file) == source_stamp:
+            sidecar = _load_vectors_sidecar(embeddings_file, len(df))
+    if sidecar is None:
+        df = _read_projected_csv(embeddings_file, DATASET_COLUMNS)
+
+    if sidecar is not None:
+        embeddings, embedding_rows = sidecar
+    elif 'embedding' in df.columns:
+        parsed, valid = parse_embedding_column(df.pop('embedding'))
+        embeddings = parsed[valid]
+        embedding_rows = np.where(valid, np.cumsum(valid) - 1, -1).astype(np.int32)
+        del parsed
+        if spill_vectors:
+            embeddings = _save_vectors_sidecar(embeddings_file, source_stamp, embeddings, embedding_rows)
+    else:
+        embedding_rows = np.full(len(df), -1)
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    return _finish_dataset(df, embedding_rows), embeddings
+
+
+def _finish_dataset(df, embedding_rows):
+    """Compact dtypes of a loaded dataset: int32 embedding_row, categorical usernames"""
+    df['embedding_row'] = embedding_rows.astype(np.int32)
+    if 'username' in df.columns:
+        df['username'] = df['username'].astype('category')
+    return df
+
+
+def tweet_id_column(df):
+    """
+    Name of the first of tweet_id, id and full_text that is filled in and unique for every row of
+    `df`, or None if none is. The collector's CSVs can leave id blank, and files in the 3-column
+    format (username, full_text, embedding) have no ID, so the text itself is tried last.
+    """
+    for name in ('tweet_id', 'id', 'full_text'):
+        if name in df.columns:
+            ids = df[name].fillna('').astype(str)
+            if (ids != '').all() and ids.is_unique:
+                return name
+    return None
@@ -1,14 +1,26 @@
 import csv
-import json
 import requests
 from datetime import datetime
 import time
-import sys
+import argparse
 import os
+from itertools import islice
+
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_FILE
+from embedding_checkpoint import checkpoint_path, find_embedding_checkpoint, save_embedding_checkpoint
+from embedding_store import OUTPUT_FORMATS, open_embedding_writer, output_file_for
+from embedding_client import EmbeddingEngine
 
 ## Run this file to generate embeddings for ALL tweets
 ## Using command:
-## python generate_embeddings_production.py <input_csv_file>
+## python generate_embeddings_production.py <input_csv_file> [--single] [--concurrency N]
+##                                            [--cache FILE | --no-cache] [--fresh] [--format csv|npy]
+##
+## Tweets are sent to LM Studio in adaptive batches by default; pass --single to fall back
+## to one tweet per request. --concurrency sets how many requests are kept in flight.
+## Embeddings are cached on disk (embedding_cache.sqlite) so re-runs only embed new texts.
+## An interrupted run resumes into the same output file; pass --fresh to start a new one.
+## --format npy writes vectors to a float32 .npy file plus a .meta.csv table instead of JSON-in-CSV.
 
 
 def generate_embeddings():
@@ -19,29 +31,82 @@ def generate_embeddings():
 
     lm_studio_url = "http://10.0.0.7:1234/v1/embeddings"
 
-    # Get input file from command line argument
-    if len(sys.argv) != 2:
-        print("Usage: python generate_embeddings_production.py <input_csv_file>")
-        print("Example: python generate_embeddings_production.py tweets_data_filtered_20250729_143022.csv")
-        return
-    
-    input_file = sys.argv[1]
+    # Get input file and options from command line arguments
+    parser = argparse.ArgumentParser(
+        description="Generate embeddings for ALL tweets in a CSV file",
+        epilog="Example: python generate_embeddings_production.py tweets_data_filtered_20250729_143022.csv"
+    )
+    parser.add_argument('input_file', help="CSV file with a full_text column")
+    parser.add_argument('--single', action='store_true', help="Send one tweet per request")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests kept in flight (default: 4)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, help=f"Embedding cache file (default: {DEFAULT_CACHE_FILE})")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the embedding cache")
+    parser.add_argument('--fresh', action='store_true', help="Ignore any checkpoint and start a new output file")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help="csv: JSON embedding column (default), npy: float32 .npy + .meta.csv")
+    args = parser.parse_args()
+
+    input_file = args.input_file
+    batched = not args.single
     
     # Verify input file exists
     if not os.path.exists(input_file):
         print(f"❌ Input file not found: {input_file}")
         return
 
-    output_file = f"tweets_with_embeddings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    # Resume an interrupted run for this input file if there is one
+    checkpoint_data, checkpoint_filename = (None, None) if args.fresh else \
+        find_embedding_checkpoint(input_file, 'production')
+    if checkpoint_data and checkpoint_data.get('output_format', 'csv') != args.format:
+        checkpoint_data, checkpoint_filename = None, None
+
+    if checkpoint_data:
+        output_file = checkpoint_data['output_file']
+        print(f"📁 Resuming from checkpoint: {checkpoint_filename}")
+        print(f"   Rows already written: {checkpoint_data['rows_committed']}")
+    else:
+        output_prefix = f"tweets_with_embeddings_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        output_file = output_file_for(output_prefix, args.format)
+        checkpoint_filename = checkpoint_path(output_file)
+        checkpoint_data = {
+            'kind': 'production',
+            'output_format': args.format,
+            'input_file': input_file,
+            'output_file': output_file,
+            'rows_committed': 0,
+            'output_bytes': 0,
+            'processed_count': 0,
+            'error_count': 0
+        }
 
     print("=== Generating Embeddings (Production) ===")
     print(f"Input: {input_file}")
     print(f"Output: {output_file}")
+    print(f"Mode: {'batched' if batched else 'single'} | Concurrency: {args.concurrency}")
 
     if not test_lmstudio_connection(lm_studio_url):
         return
 
-    process_all_tweets(input_file, output_file, lm_studio_url)
+    cache = None if args.no_cache else EmbeddingCache(args.cache)
+
+    with EmbeddingEngine(lm_studio_url, concurrency=args.concurrency, batched=batched, cache=cache) as engine:
+        process_all_tweets(input_file, output_file, engine, checkpoint_filename, checkpoint_data)
+
+    # Clean up checkpoint file when done
+    if os.path.exists(checkpoint_filename):
+        os.remove(checkpoint_filename)
+
+    if cache is not None:
+        print_cache_stats(cache)
+        cache.close()
+
+
+def print_cache_stats(cache):
+    """Print embedding cache hit/miss counters"""
+    stats = cache.stats()
+    print(f"   Cache: {stats['hits']} hits | {stats['misses']} misses | "
+          f"Hit rate: {stats['hit_rate']:.1%} | "
+          f"{stats['entries']} entries ({stats['bytes'] / 1024 ** 2:.1f} MB)")
 
 
 def test_lmstudio_connection(url):
@@ -67,72 +132,72 @@ def test_lmstudio_connection(url):
         return False
 
 
-def get_embedding_fast(text, url):
-    """Get embedding for a single text using LMStudio API"""
-    try:
-        response = requests.post(url,
-                                 json={
-                                     "model": "text-embedding-nomic-embed-text-v1.5",
-                                     "input": [text]
-                                 },
-                                 timeout=10
-                                 )
-
-        if response.status_code == 200:
-            data = response.json()
-            return data['data'][0]['embedding']
-        else:
-            return None
-
-    except Exception as e:
-        return None
-
-
-def process_all_tweets(input_file, output_file, lm_studio_url):
-    """Process ALL tweets without filtering"""
+def process_all_tweets(input_file, output_file, engine, checkpoint_filename, checkpoint_data, chunk_rows=1000):
+    """Process ALL tweets without filtering, checkpointing after every chunk"""
 
-    processed_count = 0
-    error_count = 0
+    processed_count = checkpoint_data['processed_count']
+    error_count = checkpoint_data['error_count']
+    rows_committed = checkpoint_data['rows_committed']
     start_time = time.time()
 
     print("📊 Processing all tweets in file...")
 
     with open(input_file, 'r', encoding='utf-8') as infile:
         reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames + ['embedding']
+        fieldnames = reader.fieldnames
 
-        with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
+        # Skip input rows already present in the partial output
+        for _ in islice(reader, rows_committed):
+            pass
 
-            for row in reader:
-                tweet_text = row.get('full_text', '').strip()
+        writer = open_embedding_writer(checkpoint_data.get('output_format', 'csv'), output_file,
+                                       fieldnames, checkpoint_data)
+        try:
+            writer.commit(checkpoint_data)
+            save_embedding_checkpoint(checkpoint_filename, checkpoint_data)
 
-                if tweet_text:
-                    embedding = get_embedding_fast(tweet_text, lm_studio_url)
+            # Read the input in chunks; the engine embeds each chunk concurrently
+            while True:
+                rows = list(islice(reader, chunk_rows))
+                if not rows:
+                    break
 
+                texts = [row.get('full_text', '').strip() for row in rows]
+                to_embed = [i for i, text in enumerate(texts) if text]
+
+                embeddings = engine.embed_texts([texts[i] for i in to_embed])
+                embedding_by_row = dict(zip(to_embed, embeddings))
+
+                for i, row in enumerate(rows):
+                    embedding = embedding_by_row.get(i)
+
+                    row['embedding'] = embedding
                     if embedding:
-                        row['embedding'] = json.dumps(embedding)
                         processed_count += 1
                     else:
-                        row['embedding'] = ''
                         error_count += 1
-                else:
-                    row['embedding'] = ''
-                    error_count += 1
-
-                # Progress update every 100 tweets
-                total_processed = processed_count + error_count
-                if total_processed % 100 == 0:
-                    elapsed = time.time() - start_time
-                    rate = total_processed / elapsed * 60 if elapsed > 0 else 0
-
-                    print(f"  📈 {total_processed} tweets processed | "
-                          f"Rate: {rate:.1f}/min | "
-                          f"Successful: {processed_count} | "
-                          f"Errors: {error_count}")
-
-                writer.writerow(row)
+
+                    # Progress update every 100 tweets
+                    total_processed = processed_count + error_count
+                    if total_processed % 100 == 0:
+                        elapsed = time.time() - start_time
+                        rate = total_processed / elapsed * 60 if elapsed > 0 else 0
+
+                        print(f"  📈 {total_processed} tweets processed | "
+                              f"Rate: {rate:.1f}/min | "
+                              f"Successful: {processed_count} | "
+                              f"Errors: {error_count}")
+
+                writer.writerows(rows)
+
+                # Commit the chunk, then record it in the checkpoint
+                writer.commit(checkpoint_data)
+                checkpoint_data['rows_committed'] += len(rows)
+                checkpoint_data['processed_count'] = processed_count
+                checkpoint_data['error_count'] = error_count
+                save_embedding_checkpoint(checkpoint_filename, checkpoint_data)
+        finally:
+            writer.close()
     
     elapsed = time.time() - start_time
     total_processed = processed_count + error_count
@@ -1,8 +1,14 @@
 import csv
-import json
 import requests
 from datetime import datetime
 import time
+import os
+from itertools import islice
+
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_FILE
+from embedding_checkpoint import checkpoint_path, find_embedding_checkpoint, save_embedding_checkpoint
+from embedding_store import open_embedding_writer, output_file_for
+from embedding_client import EmbeddingEngine
 
 ## Run this file to generate embeddings for tweets from specific users
 ## Using command:
@@ -22,22 +28,70 @@ def generate_embeddings():
     # input_file = "tweets_data_20250629_131806.csv"
     input_file = "tweets_data_20250714_185858.csv" # <-- DO NOT DELETE
 
-    output_file = f"tweets_with_embeddings_filtered_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-
     target_users = ['breakfast_survey'] # <-- Original file DO NOT DELETE
     # target_users = ['mcd0w']
 
+    # Send tweets to LM Studio in adaptive batches; set to False for one tweet per request
+    batched = True
+    # Number of requests kept in flight at once
+    concurrency = 4
+    # On-disk embedding cache; set to None to always call LM Studio
+    cache_file = DEFAULT_CACHE_FILE
+    # 'csv' writes a JSON embedding column; 'npy' writes a float32 .npy file plus a .meta.csv table
+    output_format = 'csv'
+
+    # Resume an interrupted run for the same input and users if there is one
+    checkpoint_data, checkpoint_filename = find_embedding_checkpoint(input_file, 'filtered')
+    if checkpoint_data and (checkpoint_data.get('target_users') != target_users or
+                            checkpoint_data.get('output_format', 'csv') != output_format):
+        checkpoint_data, checkpoint_filename = None, None
+
+    if checkpoint_data:
+        output_file = checkpoint_data['output_file']
+        print(f"📁 Resuming from checkpoint: {checkpoint_filename}")
+        print(f"   Input rows already processed: {checkpoint_data['rows_committed']}")
+    else:
+        output_prefix = f"tweets_with_embeddings_filtered_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        output_file = output_file_for(output_prefix, output_format)
+        checkpoint_filename = checkpoint_path(output_file)
+        checkpoint_data = {
+            'kind': 'filtered',
+            'output_format': output_format,
+            'input_file': input_file,
+            'output_file': output_file,
+            'target_users': target_users,
+            'rows_committed': 0,
+            'output_bytes': 0,
+            'processed_count': 0,
+            'error_count': 0,
+            'skipped_count': 0
+        }
+
     print("=== Generating Embeddings ===")
     print(f"Input: {input_file}")
     print(f"Output: {output_file}")
     print(f"Target users: {target_users}")
+    print(f"Mode: {'batched' if batched else 'single'} | Concurrency: {concurrency}")
 
     # Test connection
     if not test_lmstudio_connection(lm_studio_url):
         return
 
-    process_tweets_filtered(input_file, output_file, lm_studio_url, target_users)
+    cache = EmbeddingCache(cache_file) if cache_file else None
+
+    with EmbeddingEngine(lm_studio_url, concurrency=concurrency, batched=batched, cache=cache) as engine:
+        process_tweets_filtered(input_file, output_file, engine, target_users,
+                                checkpoint_filename, checkpoint_data)
+
+    # Clean up checkpoint file when done
+    if os.path.exists(checkpoint_filename):
+        os.remove(checkpoint_filename)
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"   Cache: {stats['hits']} hits | {stats['misses']} misses | "
+              f"Hit rate: {stats['hit_rate']:.1%}")
+        cache.close()
 
 def test_lmstudio_connection(url):
     """Test if LMStudio API is working"""
@@ -61,37 +115,17 @@ def test_lmstudio_connection(url):
         print(f"❌ Cannot connect to LMStudio: {e}")
         return False
 
-def get_embedding_fast(text, url):
-    """Get embedding for a single text using LMStudio API"""
-
-    try:
-        response = requests.post(url,
-                                 json={
-                                     "model": "text-embedding-nomic-embed-text-v1.5",
-                                     "input": [text]
-                                 },
-                                 timeout=10
-                                 )
-
-        if response.status_code == 200:
-            data = response.json()
-            return data['data'][0]['embedding']
-        else:
-            return None
-
-    except Exception as e:
-        return None
-
 # Process tweets with filtering for specific users
 # This function reads tweets from a CSV file, filters for specific users, and generates embeddings using LMStudio API.
 # It writes the results to a new CSV file, including the embeddings for each tweet.
 # It also provides progress updates and error handling.
-def process_tweets_filtered(input_file, output_file, lm_studio_url, target_users):
-    """Process tweets with filtering for specific users"""
+def process_tweets_filtered(input_file, output_file, engine, target_users, checkpoint_filename, checkpoint_data,
+                            chunk_rows=1000):
+    """Process tweets with filtering for specific users, checkpointing after every chunk"""
 
-    processed_count = 0
-    error_count = 0
-    skipped_count = 0
+    processed_count = checkpoint_data['processed_count']
+    error_count = checkpoint_data['error_count']
+    skipped_count = checkpoint_data['skipped_count']
     start_time = time.time()
 
     # First pass: count tweets for target users
@@ -107,47 +141,66 @@ def process_tweets_filtered(input_file, output_file, lm_studio_url, target_users
     # Second pass: process tweets
     with open(input_file, 'r', encoding='utf-8') as infile:
         reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames + ['embedding']
+        fieldnames = reader.fieldnames
+
+        # Skip input rows already handled by the interrupted run
+        for _ in islice(reader, checkpoint_data['rows_committed']):
+            pass
 
-        with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
+        writer = open_embedding_writer(checkpoint_data.get('output_format', 'csv'), output_file,
+                                       fieldnames, checkpoint_data)
+        try:
+            writer.commit(checkpoint_data)
+            save_embedding_checkpoint(checkpoint_filename, checkpoint_data)
 
-            for row in reader:
-                username = row['username']
+            # Read the input in chunks; the engine embeds each chunk concurrently
+            while True:
+                chunk = list(islice(reader, chunk_rows))
+                if not chunk:
+                    break
 
                 # Skip users not in target list
-                if username not in target_users:
-                    skipped_count += 1
-                    continue
+                rows = [row for row in chunk if row['username'] in target_users]
+                skipped_count += len(chunk) - len(rows)
 
-                tweet_text = row.get('full_text', '').strip()
+                texts = [row.get('full_text', '').strip() for row in rows]
+                to_embed = [i for i, text in enumerate(texts) if text]
 
-                if tweet_text:
-                    embedding = get_embedding_fast(tweet_text, lm_studio_url)
+                embeddings = engine.embed_texts([texts[i] for i in to_embed])
+                embedding_by_row = dict(zip(to_embed, embeddings))
 
+                for i, row in enumerate(rows):
+                    embedding = embedding_by_row.get(i)
+
+                    row['embedding'] = embedding
                     if embedding:
-                        row['embedding'] = json.dumps(embedding)
                         processed_count += 1
-                    else:
-                        row['embedding'] = ''
+                    elif i in embedding_by_row:
                         error_count += 1
-                else:
-                    row['embedding'] = ''
-
-                # Progress update every 25 tweets
-                if (processed_count + error_count) % 25 == 0:
-                    elapsed = time.time() - start_time
-                    rate = (processed_count + error_count) / elapsed * 60 if elapsed > 0 else 0
-                    remaining_tweets = target_tweet_count - processed_count - error_count
-                    remaining_time = remaining_tweets / rate if rate > 0 else 0
-
-                    print(f"  📈 {processed_count + error_count}/{target_tweet_count} tweets | "
-                          f"Rate: {rate:.1f}/min | "
-                          f"ETA: {remaining_time:.1f} minutes | "
-                          f"Errors: {error_count}")
-
-                writer.writerow(row)
+
+                    # Progress update every 25 tweets
+                    if (processed_count + error_count) % 25 == 0:
+                        elapsed = time.time() - start_time
+                        rate = (processed_count + error_count) / elapsed * 60 if elapsed > 0 else 0
+                        remaining_tweets = target_tweet_count - processed_count - error_count
+                        remaining_time = remaining_tweets / rate if rate > 0 else 0
+
+                        print(f"  📈 {processed_count + error_count}/{target_tweet_count} tweets | "
+                              f"Rate: {rate:.1f}/min | "
+                              f"ETA: {remaining_time:.1f} minutes | "
+                              f"Errors: {error_count}")
+
+                writer.writerows(rows)
+
+                # Commit the chunk, then record it in the checkpoint
+                writer.commit(checkpoint_data)
+                checkpoint_data['rows_committed'] += len(chunk)
+                checkpoint_data['processed_count'] = processed_count
+                checkpoint_data['error_count'] = error_count
+                checkpoint_data['skipped_count'] = skipped_count
+                save_embedding_checkpoint(checkpoint_filename, checkpoint_data)
+        finally:
+            writer.close()
     
     elapsed = time.time() - start_time
     print(f"\n✅ Complete! Processed {processed_count} tweets in {elapsed / 60:.1f} minutes")
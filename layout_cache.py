@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from umap.umap_ import nearest_neighbors
+
+###############################################################################################
+# layout_cache.py
+# Disk-persisted cache for fitted UMAP layouts. Entries are keyed by a hash of the embeddings
+# file contents plus the UMAP/sampling parameters, and hold the fitted reducer together with
+# the 2D coordinates, so a Streamlit restart (or "Refresh Data") loads an existing layout from
+# disk instead of refitting. Least-recently-used entries are evicted once the cache directory
+# grows past max_bytes. The same cache also stores the k-nearest-neighbour graph of a dataset,
+# built once at the largest n_neighbors, so changing min_dist/spread/n_neighbors only reruns the
+# UMAP optimization stage instead of the neighbour search.
+###############################################################################################
+
+DEFAULT_LAYOUT_CACHE_DIR = "layout_cache"
+
+
+def file_content_hash(*paths):
+    """SHA-256 over the contents of one or more files"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def layout_key(data_hash, **params):
+    """Cache key for a dataset hash plus layout parameters"""
+    payload = json.dumps({'data': data_hash, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LayoutCache:
+    """
+    Directory of pickled layouts with LRU eviction by total size.
+    The last few entries read are also kept in memory so reruns don't unpickle them again.
+    Safe to share between Streamlit session threads.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_LAYOUT_CACHE_DIR, max_bytes=1024 ** 3, memory_entries=4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """Return the cached entry for `key`, or None"""
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._loaded[key] = entry
+            while len(self._loaded) > self.memory_entries:
+                self._loaded.popitem(last=False)
+
+    def put(self, key, entry):
+        """Store `entry` atomically, then evict old entries if over budget"""
+        path = self._path(key)
+        # A temp file of its own, so sessions saving the same key at once don't clobber each other
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        # Drop a stale in-memory copy of an overwritten entry
+        with self._lock:
+            self._loaded.pop(key, None)
+        self.evict()
+
+    def evict(self):
+        """Delete least-recently-used entries until the directory is under max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Evicted by another session meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        # Never evict the most recent entry, even if it alone is over budget
+        for _, size, path in sorted(entries)[:-1]:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+##################################################################################################
+# Reusable k-nearest-neighbour graph
+##################################################################################################
+def build_knn_graph(embeddings, n_neighbors, metric='cosine', random_state=42):
+    """
+    Nearest-neighbour graph in the form UMAP accepts as precomputed_knn:
+    (knn_indices, knn_dists, knn_search_index). The search index keeps transform() working.
+    """
+    n_neighbors = min(n_neighbors, len(embeddings) - 1)
+    return nearest_neighbors(embeddings, n_neighbors, metric, {}, False,
+                             np.random.RandomState(random_state))
+
+
+def slice_knn_graph(knn_graph, n_neighbors):
+    """Trim a graph built at a larger k down to n_neighbors, or None if it is too small"""
+    knn_indices, knn_dists, knn_search_index = knn_graph
+    if knn_indices.shape[1] < n_neighbors:
+        return None
+    return knn_indices[:, :n_neighbors], knn_dists[:, :n_neighbors], knn_search_index
@@ -0,0 +1,51 @@
+import numpy as np
+
+from vector_index import normalize_rows
+
+###############################################################################################
+# pca_reduction.py
+# Optional pre-reduction before UMAP: embeddings are L2-normalized (so Euclidean geometry matches
+# the cosine metric) and projected onto their top principal components with randomized PCA,
+# e.g. 768 -> 50 dimensions. The neighbour search and UMAP then work on a much smaller matrix.
+# ReducedUMAP wraps a UMAP model fitted on reduced vectors so transform() still takes raw
+# embeddings, which keeps test-tweet placement and incremental updates unchanged.
+###############################################################################################
+
+DEFAULT_PCA_DIM = 50
+
+
+class PcaReducer:
+    """L2 normalization followed by randomized PCA"""
+
+    def __init__(self, n_components=DEFAULT_PCA_DIM, random_state=42):
+        self.n_components = n_components
+        self.random_state = random_state
+        self.pca = None
+
+    def fit(self, embeddings):
+        from sklearn.decomposition import PCA
+
+        normalized = normalize_rows(embeddings)
+        n_components = min(self.n_components, *normalized.shape)
+        self.pca = PCA(n_components=n_components, svd_solver='randomized', random_state=self.random_state)
+        self.pca.fit(normalized)
+        return self
+
+    def transform(self, embeddings):
+        return self.pca.transform(normalize_rows(embeddings)).astype(np.float32)
+
+    @property
+    def explained_variance(self):
+        """Share of the (normalized) embeddings' variance kept by the components"""
+        return float(self.pca.explained_variance_ratio_.sum())
+
+
+class ReducedUMAP:
+    """A UMAP model fitted on PCA-reduced vectors; transform() takes raw embeddings"""
+
+    def __init__(self, pca_reducer, umap_model):
+        self.pca_reducer = pca_reducer
+        self.umap_model = umap_model
+
+    def transform(self, embeddings):
+        return self.umap_model.transform(self.pca_reducer.transform(embeddings))
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from umap_layout import SAMPLING_MODES, embeddings_file_hash, fit_layout
+
+## Run this file to fit a UMAP layout offline, so the Streamlit app finds it in the layout cache
+## Using command:
+## python precompute_layout.py <embeddings_file> [--n-neighbors N] [--min-dist D] [--spread S]
+##                             [--max-tweets N] [--sampling random|coreset] [--pca-dim N]
+##
+## The defaults match the app's sidebar defaults (PCA off). --pca-dim N L2-normalizes the embeddings
+## and reduces them with randomized PCA to N dimensions before UMAP, like ticking "PCA pre-reduction"
+## in the app (see pca_reduction.py); the fitted PCA is cached per dataset.
+
+# Matches MAX_N_NEIGHBORS in streamlit_app.py, so the app can reuse the cached kNN graph
+KNN_NEIGHBORS = 200
+
+
+def precompute_layout():
+    parser = argparse.ArgumentParser(description="Fit a UMAP layout into the layout cache")
+    parser.add_argument('embeddings_file', help="Embeddings file (.csv or binary .meta.csv store)")
+    parser.add_argument('--n-neighbors', type=int, default=15)
+    parser.add_argument('--min-dist', type=float, default=0.1)
+    parser.add_argument('--spread', type=float, default=1.0)
+    parser.add_argument('--max-tweets', type=int, default=21000)
+    parser.add_argument('--sampling', choices=SAMPLING_MODES, default='random')
+    parser.add_argument('--pca-dim', type=int, default=None,
+                        help="Reduce to this many PCA dimensions before UMAP (default: no PCA)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.embeddings_file):
+        print(f"❌ Embeddings file not found: {args.embeddings_file}")
+        return
+
+    start_time = time.time()
+    layout = fit_layout(
+        args.embeddings_file, embeddings_file_hash(args.embeddings_file), args.n_neighbors, args.min_dist,
+        args.spread, args.max_tweets, KNN_NEIGHBORS, sampling=args.sampling,
+        pca_dim=args.pca_dim,
+        progress=lambda fraction, message: print(f"⏳ {fraction:.0%} {message}")
+    )
+
+    print(f"\n✅ Layout of {len(layout['ids']):,} tweets fitted in {time.time() - start_time:.1f}s")
+    if 'explained_variance' in layout:
+        print(f"   PCA to {args.pca_dim} dimensions keeps {layout['explained_variance']:.1%} of the variance")
+
+
+if __name__ == "__main__":
+    precompute_layout()
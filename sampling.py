@@ -0,0 +1,79 @@
+import numpy as np
+
+from vector_index import normalize_rows
+
+###############################################################################################
+# sampling.py
+# Structure-preserving subsampling. cap_per_group keeps at most the same number of points from
+# every group, so small groups survive whole while large ones are thinned; it backs both the
+# density-aware plot downsampling (groups = grid cells) and coreset_sample (groups = k-means
+# clusters in embedding space), which picks the tweets UMAP is fitted on when the data is larger
+# than max_tweets, so small but distinct clusters are not lost the way uniform sampling loses them.
+###############################################################################################
+
+
+def cap_per_group(group_ids, max_points, random_state=42):
+    """
+    Sorted positions of at most `max_points` items, taking at most `cap` random items per group,
+    with `cap` the largest value that fits the budget; the leftover budget is filled with one more
+    item from some of the groups that still have more.
+    """
+    group_ids = np.asarray(group_ids)
+    n = len(group_ids)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points <= 0:
+        return np.arange(0)
+
+    # Shuffle, then group; an item's rank within its group decides whether it is kept
+    rng = np.random.default_rng(random_state)
+    shuffled = rng.permutation(n)
+    by_group = shuffled[np.argsort(group_ids[shuffled], kind='stable')]
+    sorted_groups = group_ids[by_group]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    ranks = np.arange(n) - np.repeat(starts, counts)
+
+    # Binary search for the largest per-group cap within budget
+    low, high = 0, int(counts.max())
+    while low < high:
+        cap = (low + high + 1) // 2
+        if np.minimum(counts, cap).sum() <= max_points:
+            low = cap
+        else:
+            high = cap - 1
+    cap = low
+
+    keep = ranks < cap
+    extra = max_points - int(keep.sum())
+    if extra > 0:
+        candidates = np.flatnonzero(ranks == cap)
+        keep[rng.choice(candidates, size=min(extra, len(candidates)), replace=False)] = True
+
+    return np.sort(by_group[keep])
+
+
+def coreset_sample(embeddings, size, n_clusters=256, random_state=42, fit_rows=100_000, block_rows=65536):
+    """
+    Positions of `size` rows of `embeddings` covering every region of the embedding space.
+    Rows are clustered with mini-batch k-means on L2-normalized vectors (cosine geometry), then
+    cap_per_group takes the same number of rows from every cluster, all of a cluster if it is small.
+    k-means is fitted on at most `fit_rows` random rows and labels are assigned `block_rows` at a
+    time, so a memory-mapped matrix is never loaded whole.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    n = len(embeddings)
+    if n <= size:
+        return np.arange(n)
+
+    rng = np.random.default_rng(random_state)
+    fit_positions = np.sort(rng.choice(n, size=fit_rows, replace=False)) if n > fit_rows else np.arange(n)
+    kmeans = MiniBatchKMeans(n_clusters=min(n_clusters, size), batch_size=4096,
+                             n_init=1, random_state=random_state)
+    kmeans.fit(normalize_rows(embeddings[fit_positions]))
+
+    labels = np.concatenate([kmeans.predict(normalize_rows(embeddings[start:start + block_rows]))
+                             for start in range(0, n, block_rows)])
+    return cap_per_group(labels, size, random_state=random_state)
+
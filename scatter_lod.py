@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from sampling import cap_per_group
+
+###############################################################################################
+# scatter_lod.py
+# Level-of-detail helpers for the Streamlit scatter plot. Above a few thousand points the app
+# switches to WebGL (Scattergl), shortens hover labels and, past the point budget, thins the
+# layout with density-aware downsampling: the plane is cut into a grid and every cell keeps at
+# most the same number of points, so dense clusters are thinned while sparse regions and
+# outliers stay fully visible.
+###############################################################################################
+
+# Hover labels in large-data mode are cut to this many characters; the full tweet is shown on click
+HOVER_TEXT_CHARS = 140
+
+
+def density_downsample(coordinates, max_points, grid_size=128, random_state=42):
+    """
+    Sorted row indices of at most `max_points` points of an (N, 2) coordinate array.
+    Every grid cell keeps the same capped number of random points (see sampling.cap_per_group).
+    """
+    coordinates = np.asarray(coordinates)
+    n = len(coordinates)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points <= 0:
+        return np.arange(0)
+
+    mins = coordinates.min(axis=0)
+    spans = np.ptp(coordinates, axis=0)
+    spans[spans == 0] = 1
+    cells = np.minimum(((coordinates - mins) / spans * grid_size).astype(np.int64), grid_size - 1)
+    return cap_per_group(cells[:, 0] * grid_size + cells[:, 1], max_points, random_state)
+
+
+def truncate_hover_text(texts, max_chars=HOVER_TEXT_CHARS):
+    """Cut each text to `max_chars` characters, marking cut texts with an ellipsis"""
+    texts = pd.Series(texts, dtype=object).fillna('').astype(str)
+    truncated = texts.str.slice(0, max_chars)
+    too_long = texts.str.len() > max_chars
+    truncated[too_long] = truncated[too_long] + '…'
+    return truncated.to_numpy()
@@ -1,20 +1,31 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import umap
 import plotly.graph_objects as go
 import plotly.express as px
-import ast
 import requests
 from datetime import datetime
 import glob
 import os
 import sys
+import time
+
+from background_fit import FitScheduler, FitWorker
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from embedding_client import EMBEDDING_MODEL
+from embedding_store import load_tweet_dataset
+from layout_cache import LayoutCache
+from pca_reduction import DEFAULT_PCA_DIM
+from scatter_lod import density_downsample, truncate_hover_text
+from tweet_overlay import TweetOverlayStore, overlay_path_for
+from umap_layout import DEFAULT_REFIT_FRACTION, embeddings_file_hash, layout_cache_key
+from vector_index import build_vector_index
 
 #####################################################################################################
 # Streamlit app for dynamic tweet embedding visualization
 # This app allows users to visualize tweet embeddings using UMAP and interactively add test tweets.
-# It connects to LM Studio API for generating embeddings and manages test tweets in a CSV file.
+# It connects to LM Studio API for generating embeddings and keeps test tweets in an overlay file
+# next to the embeddings file.
 # run with: streamlit run streamlit_app.py
 #####################################################################################################
 
@@ -68,8 +79,11 @@ def get_embeddings_file():
 #####################################################################################################
 st.sidebar.header("🎛️ UMAP Configuration")
 
+# Upper bound of the n_neighbors slider; the cached kNN graph is built at this k
+MAX_N_NEIGHBORS = 200
+
 with st.sidebar.expander("Clustering Parameters", expanded=True):
-    n_neighbors = st.slider("n_neighbors", min_value=5, max_value=200, value=15, 
+    n_neighbors = st.slider("n_neighbors", min_value=5, max_value=MAX_N_NEIGHBORS, value=15, 
                            help="Controls local vs global structure. Lower = more local clusters")
     min_dist = st.slider("min_dist", min_value=0.0, max_value=1.0, value=0.1, step=0.05,
                         help="Minimum distance between points. Lower = tighter clusters")
@@ -78,211 +92,303 @@ with st.sidebar.expander("Clustering Parameters", expanded=True):
     
     # Sample size for faster processing
     max_tweets = st.slider("Max tweets to visualize", min_value=1000, max_value=50000, value=21000, step=1000,
-                          help="Reduce for faster processing")
+                          help="Reduce for faster processing. With coreset sampling, the number of tweets UMAP is fitted on")
+    sampling_label = st.radio("Sampling", ["Random", "Coreset (k-means)"], horizontal=True,
+                              help="Above max tweets: Random fits and draws a uniform sample. Coreset fits on tweets "
+                                   "picked from every k-means cluster, so small clusters survive, and projects all "
+                                   "other tweets into the layout")
+    sampling = 'coreset' if sampling_label.startswith("Coreset") else 'random'
+    use_pca = st.checkbox("PCA pre-reduction", value=False,
+                          help="L2-normalize and reduce the embeddings with randomized PCA before UMAP; "
+                               "much faster neighbour search and less memory on large datasets")
+    pca_dim = st.slider("PCA dimensions", min_value=10, max_value=200, value=DEFAULT_PCA_DIM, step=10,
+                        disabled=not use_pca)
+    # Filled in once the layout is loaded
+    explained_variance_slot = st.empty()
+    if not use_pca:
+        pca_dim = None
+
+# Above this many points "Auto" switches to WebGL with shortened hover labels
+LARGE_DATA_THRESHOLD = 5000
+
+with st.sidebar.expander("Rendering", expanded=False):
+    render_mode = st.radio("Render mode", ["Auto", "Standard (SVG)", "Large data (WebGL)"],
+                           help=f"Auto uses WebGL above {LARGE_DATA_THRESHOLD:,} points")
+    max_plotted_points = st.slider("Max points drawn", min_value=1000, max_value=50000, value=20000, step=1000,
+                                   help="Dense clusters are thinned beyond this; sparse regions stay complete")
+
+with st.sidebar.expander("Data Updates", expanded=False):
+    incremental = st.checkbox("Incremental layout updates", value=True,
+                              help="Project newly collected tweets into the last layout instead of refitting")
+    refit_percent = st.slider("Refit when new tweets exceed (%)", min_value=5, max_value=50,
+                              value=int(DEFAULT_REFIT_FRACTION * 100), step=5, disabled=not incremental)
+
+#####################################################################################################
+# Disk-persisted UMAP layouts, so server restarts and "Refresh Data" don't force a refit
+#####################################################################################################
+@st.cache_resource
+def get_layout_cache():
+    """Open the on-disk layout cache once per process"""
+    return LayoutCache()
+
+@st.cache_resource
+def get_fit_worker():
+    """Start the background fit worker once per server process"""
+    return FitWorker()
+
+@st.cache_data(max_entries=4)
+def get_embeddings_file_hash(embeddings_file, mtime_ns, size):
+    """Content hash of one version of the embeddings file (recomputed when its mtime or size changes)"""
+    return embeddings_file_hash(embeddings_file)
 
 #####################################################################################################
-# Load and process tweet data from CSV, filter out invalid embeddings, and return valid embeddings and their indices.
-# This function reads a CSV file containing tweet embeddings, processes the embeddings to ensure they are valid,
-# and returns a NumPy array of valid embeddings along with their corresponding row indices in the original DataFrame.
+# Fit UMAP layouts in a background worker process.
+# A layout already on disk is returned immediately. Otherwise a fit is started and None is returned
+# until it finishes, so the page can keep showing the last completed layout in the meantime.
+# Either way a fit this session started for other slider values is cancelled.
+# In incremental mode the worker extends the last layout fitted with these parameters when the
+# embeddings file only adds a few new tweets to it.
 #####################################################################################################
-@st.cache_data 
-def load_base_tweets_and_fit_umap(n_neighbors, min_dist, spread, max_tweets):
+def load_base_tweets_and_fit_umap(n_neighbors, min_dist, spread, max_tweets, incremental=False,
+                                  refit_fraction=DEFAULT_REFIT_FRACTION, sampling='random', pca_dim=None):
     """
-    Load base tweets (excluding test tweets), fit UMAP model, and return the model and base coordinates.
-    This function is cached and should never be cleared to maintain consistent positioning.
+    Return the layout dict (reducer, coordinates, indices, total_base_tweets, key) for these parameters,
+    or None while it is still being fitted in the background.
     """
     embeddings_file = get_embeddings_file()
     if not embeddings_file:
-        return None, None, None
-        
-    try:
-        df = pd.read_csv(embeddings_file, quotechar='"', on_bad_lines='skip', dtype=str)
-    except:
-        try:
-            df = pd.read_csv(embeddings_file, quotechar='"', error_bad_lines=False, warn_bad_lines=False, dtype=str)
-        except:
-            df = pd.read_csv(embeddings_file, sep=',', quotechar='"', on_bad_lines='skip', engine='python', dtype=str)
-    
-    # Split into base tweets and test tweets BEFORE sampling
-    test_tweets_mask = df.iloc[:, 0].str.startswith('999', na=False)
-    base_tweets_df = df[~test_tweets_mask]
-    test_tweets_df = df[test_tweets_mask]
-    
-    if len(base_tweets_df) > max_tweets:
-        base_tweets_df = base_tweets_df.sample(n=max_tweets, random_state=42)
-        st.info(f"📊 Sampled {max_tweets:,} base tweets from {len(df[~test_tweets_mask]):,} total")
-    
-    # Combine back together - test tweets are ALWAYS included
-    df = pd.concat([base_tweets_df, test_tweets_df], ignore_index=True)
-    
-    base_embeddings = []
-    base_indices = []
-    
-    for i, embedding_str in enumerate(df['embedding']):
-        tweet_id = str(df.iloc[i].iloc[0]) if pd.notna(df.iloc[i].iloc[0]) else ""
-        if tweet_id.startswith('999'):
-            continue
-            
-        try:
-            if pd.notna(embedding_str) and embedding_str != 'nan':
-                embedding = ast.literal_eval(embedding_str)
-                base_embeddings.append(embedding)
-                base_indices.append(i)
-        except:
-            continue
-    
-    base_embeddings = np.array(base_embeddings)
-    
-    reducer = umap.UMAP(
-        n_components=2, 
-        random_state=42, 
-        spread=spread, 
-        min_dist=min_dist,
-        n_neighbors=n_neighbors,
-        metric='cosine'
-    )
-    base_coordinates = reducer.fit_transform(base_embeddings)
-    
-    return reducer, base_coordinates, base_indices
+        return None
+
+    file_stat = os.stat(embeddings_file)
+    data_hash = get_embeddings_file_hash(embeddings_file, file_stat.st_mtime_ns, file_stat.st_size)
+    # A full fit on this exact data is always good; incremental mode also accepts an extended layout
+    candidate_keys = [layout_cache_key(data_hash, n_neighbors, min_dist, spread, max_tweets, sampling=sampling,
+                                       pca_dim=pca_dim)]
+    if incremental:
+        candidate_keys.append(layout_cache_key(data_hash, n_neighbors, min_dist, spread, max_tweets,
+                                               incremental=True, sampling=sampling, pca_dim=pca_dim))
+
+    for cache_key in candidate_keys:
+        layout = get_layout_cache().get(cache_key)
+        if layout is not None:
+            # A fit still running for slider values the user has moved away from is no longer needed
+            fit_scheduler = st.session_state.get('fit_scheduler')
+            if fit_scheduler is not None and fit_scheduler.current is not None \
+                    and fit_scheduler.current.fit_key not in candidate_keys:
+                fit_scheduler.cancel()
+            return {**layout, 'key': cache_key}
+
+    if 'fit_scheduler' not in st.session_state:
+        st.session_state.fit_scheduler = FitScheduler(get_fit_worker())
+
+    st.session_state.fit_scheduler.request(cache_key, {
+        'embeddings_file': embeddings_file,
+        'data_hash': data_hash,
+        'n_neighbors': n_neighbors,
+        'min_dist': min_dist,
+        'spread': spread,
+        'max_tweets': max_tweets,
+        'knn_neighbors': MAX_N_NEIGHBORS,
+        'incremental': incremental,
+        'refit_fraction': refit_fraction,
+        'sampling': sampling,
+        'pca_dim': pca_dim
+    })
+    return None
 
 ############################################################################################################
-# Load current CSV data including any test tweets.
-# This function gets cleared when test tweets are added/removed.
+# Load the current dataset once per file version.
+# The file is read with only the columns the app uses and its embeddings opened as a read-only memory-mapped
+# float32 matrix (binary stores directly, CSV files through a parsed .vectors.npy sidecar); the result is
+# shared by every session and reloaded when the file's mtime or size changes.
 ############################################################################################################
+@st.cache_resource(max_entries=2)
+def get_tweet_dataset(embeddings_file, mtime_ns, size):
+    """(DataFrame, embedding matrix) of one version of the embeddings file"""
+    return load_tweet_dataset(embeddings_file)
+
 def load_current_data():
-    """
-    Load current CSV data including any test tweets.
-    This function gets cleared when test tweets are added/removed.
-    """
+    """Return (DataFrame, embedding matrix) of the current embeddings file, or None"""
     embeddings_file = get_embeddings_file()
     if not embeddings_file:
         return None
-        
+
+    file_stat = os.stat(embeddings_file)
+    return get_tweet_dataset(embeddings_file, file_stat.st_mtime_ns, file_stat.st_size)
+
+############################################################################################################
+# Similarity index over the base tweets of the loaded embedding matrix (all of them, not only the
+# tweets sampled for the layout), built once per file version and shared by every session
+############################################################################################################
+@st.cache_resource(max_entries=2)
+def get_similarity_index(embeddings_file, mtime_ns, size):
+    """(vector index, DataFrame row of each indexed vector) for one version of the embeddings file"""
+    df, embeddings = get_tweet_dataset(embeddings_file, mtime_ns, size)
+    embedding_rows = df['embedding_row'].to_numpy()
+    is_base = (embedding_rows >= 0) & ~df.iloc[:, 0].str.startswith('999', na=False).to_numpy()
+    df_rows = np.flatnonzero(is_base)
+    base_rows = embedding_rows[df_rows]
+    # Index the shared matrix in place unless some of its rows must be left out
+    if not np.array_equal(base_rows, np.arange(len(embeddings))):
+        embeddings = embeddings[base_rows]
+    return build_vector_index(embeddings), df_rows
+
+def find_similar_tweets(embedding, k):
+    """Top-k base tweets by cosine similarity to `embedding`, as a DataFrame"""
+    embeddings_file = get_embeddings_file()
+    file_stat = os.stat(embeddings_file)
+    df, _ = get_tweet_dataset(embeddings_file, file_stat.st_mtime_ns, file_stat.st_size)
+    index, df_rows = get_similarity_index(embeddings_file, file_stat.st_mtime_ns, file_stat.st_size)
+
+    similarities, positions = index.search(np.asarray(embedding, dtype=np.float32), k)
+    matches = df.iloc[df_rows[positions]]
+    return pd.DataFrame({
+        'similarity': similarities,
+        'username': matches['username'].astype(str).to_numpy() if 'username' in matches else '',
+        'full_text': matches['full_text'].to_numpy()
+    })
+
+############################################################################################################
+# Resident memory of this server process (all sessions together), shown in the sidebar
+############################################################################################################
+def process_rss_bytes():
+    """Current resident set size of this process in bytes (peak RSS without /proc, None on Windows)"""
     try:
-        df = pd.read_csv(embeddings_file, quotechar='"', on_bad_lines='skip', dtype=str)
-    except:
-        try:
-            df = pd.read_csv(embeddings_file, quotechar='"', error_bad_lines=False, warn_bad_lines=False, dtype=str)
-        except:
-            df = pd.read_csv(embeddings_file, sep=',', quotechar='"', on_bad_lines='skip', engine='python', dtype=str)
-    
-    return df
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+############################################################################################################
+# Embedding caches shared by every session of this server process:
+# an in-memory LRU of query embeddings in front of the on-disk embedding cache
+############################################################################################################
+@st.cache_resource
+def get_embedding_cache():
+    """Open the persistent embedding cache once per process"""
+    return EmbeddingCache()
+
+@st.cache_resource
+def get_query_embedding_cache():
+    """In-memory LRU of test-tweet embeddings, backed by the on-disk cache"""
+    return QueryEmbeddingCache(max_entries=1024, backing=get_embedding_cache())
 
 ############################################################################################################
 # Get real embedding from LM Studio API
 # This function connects to the LM Studio API to get embeddings for a given text.
+# Recently used texts come from memory and texts embedded before (by this app or the embedding
+# scripts) from the on-disk cache. Analysts submitting the same text at the same time share one request.
 # It handles connection errors and returns None if the request fails.
 ############################################################################################################
+def request_embedding(text):
+    """POST one text to LM Studio and return its embedding; raises on failure"""
+    lm_studio_url = "http://10.0.0.7:1234/v1/embeddings"
+
+    response = requests.post(lm_studio_url,
+                           json={
+                               "model": EMBEDDING_MODEL,
+                               "input": [text]
+                           },
+                           timeout=10
+                           )
+
+    if response.status_code != 200:
+        raise RuntimeError(f"LM Studio API error: {response.status_code}")
+    return response.json()['data'][0]['embedding']
+
 def get_embedding_from_lmstudio(text):
     """Get real embedding from LM Studio API"""
-    lm_studio_url = "http://10.0.0.7:1234/v1/embeddings"
-    
     try:
-        response = requests.post(lm_studio_url,
-                               json={
-                                   "model": "text-embedding-nomic-embed-text-v1.5",
-                                   "input": [text]
-                               },
-                               timeout=10
-                               )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data['data'][0]['embedding']
-        else:
-            st.error(f"LM Studio API error: {response.status_code}")
-            return None
-            
+        return get_query_embedding_cache().get_or_compute(EMBEDDING_MODEL, text, request_embedding)
+    except RuntimeError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Cannot connect to LM Studio: {e}")
         return None
 
 ############################################################################################################
-# Add a test tweet with real LM Studio embedding to the CSV file
+# Test tweets live in an overlay store next to the embeddings file, never in the file itself.
+# Adding or removing one appends a single line to the overlay log; the store is shared by all sessions.
+############################################################################################################
+@st.cache_resource
+def get_tweet_overlay(embeddings_file):
+    """Open the test-tweet overlay store of an embeddings file once per process"""
+    return TweetOverlayStore(overlay_path_for(embeddings_file))
+
+############################################################################################################
+# Add a test tweet with real LM Studio embedding to the overlay store
 # This function generates a unique ID for the test tweet, retrieves its embedding,
-# and appends it to the specified CSV file in the correct format.
-# It handles both 3-column and original tweet formats.
+# projects it with the layout on screen and records all three in the overlay store.
 ############################################################################################################
-def add_test_tweet_to_csv(tweet_text, csv_file_path):
-    """Add a test tweet with real LM Studio embedding to the CSV file"""
-    
+def add_test_tweet(tweet_text, overlay, layout):
+    """Add a test tweet with real LM Studio embedding; returns its ID or None"""
+
     with st.spinner("Getting embedding from LM Studio..."):
         test_embedding = get_embedding_from_lmstudio(tweet_text)
-    
+
     if test_embedding is None:
         return None
-    
-    test_embedding_str = str(test_embedding)
-    
-    unique_id = int(f"999{int(datetime.now().timestamp() * 1000) % 100000000}")
-    
-    # Read the header to get exact column structure
-    with open(csv_file_path, 'r', encoding='utf-8') as f:
-        header_line = f.readline().strip()
-        columns = header_line.split(',')
-    
-    st.write(f"🔍 CSV has {len(columns)} columns: {columns[:3]}...")
-    
-    # Create row with exact same number of columns
-    current_date = datetime.now().strftime('%Y-%m-%d')
-    
-    # Build row data matching exact structure
-    row_data = [str(unique_id)]
-    
-    # Fill remaining columns based on expected structure
-    for i in range(1, len(columns)):
-        col_name = columns[i].strip('"').lower()
-        if 'full_text' in col_name or 'text' in col_name:
-            row_data.append(f'"{tweet_text.replace(chr(34), chr(34)+chr(34))}"')
-        elif 'embedding' in col_name:
-            row_data.append(f'"{test_embedding_str}"')
-        elif 'username' in col_name:
-            row_data.append('testuser')
-        elif 'date' in col_name:
-            row_data.append(current_date)
-        else:
-            row_data.append('')  # Empty for other columns
-    
-    csv_row = ','.join(row_data) + '\n'
-    
-    # Append to file
-    with open(csv_file_path, 'a', encoding='utf-8') as f:
-        f.write(csv_row)
-    
-    return unique_id, test_embedding
+
+    unique_id = f"999{int(datetime.now().timestamp() * 1000) % 100000000}"
+
+    # Place the test tweet with the layout currently on screen
+    test_coordinates = layout['reducer'].transform([test_embedding])
+
+    overlay.add(unique_id, tweet_text, test_embedding, layout['key'], test_coordinates[0])
+    return unique_id
 
 ############################################################################################################
-# Remove all test tweets from the CSV file using ID range
-# This function filters out rows where the ID starts with '999' and rewrites the CSV.
-# It returns the number of removed tweets.
+# Coordinates of all test tweets in a layout
+# Test tweets added while another layout was on screen are projected with this layout's reducer
+# (in one batch) and recorded in the overlay, so each tweet is transformed once per layout.
 ############################################################################################################
-def remove_test_tweets_from_csv(csv_file_path):
-    """Remove all test tweets from the CSV file using ID range"""
-    try:
-        df = pd.read_csv(csv_file_path, quotechar='"', on_bad_lines='skip', dtype=str)
-    except:
-        try:
-            df = pd.read_csv(csv_file_path, quotechar='"', error_bad_lines=False, warn_bad_lines=False, dtype=str)
-        except:
-            df = pd.read_csv(csv_file_path, sep=',', quotechar='"', on_bad_lines='skip', engine='python', dtype=str)
-    
-    df.iloc[:, 0] = df.iloc[:, 0].fillna("")
-    
-    # Filter out rows where ID starts with '999'
-    original_df = df[~df.iloc[:, 0].str.startswith('999')]
-    
-    # Write back to CSV
-    original_df.to_csv(csv_file_path, index=False)
-    
-    return len(df) - len(original_df)
+def place_test_tweets(overlay, layout):
+    """Return (ids, (N, 2) coordinates, texts) of the test tweets in `layout`"""
+    unplaced = overlay.unplaced(layout['key'])
+    if unplaced:
+        coordinates = layout['reducer'].transform(np.array([embedding for _, embedding in unplaced], dtype=np.float32))
+        overlay.place(layout['key'], {tweet_id: xy for (tweet_id, _), xy in zip(unplaced, coordinates)})
+
+    tweets = [(tweet_id, tweet) for tweet_id, tweet in overlay.items() if layout['key'] in tweet['coordinates']]
+    ids = [tweet_id for tweet_id, _ in tweets]
+    coordinates = np.array([tweet['coordinates'][layout['key']] for _, tweet in tweets], dtype=np.float32).reshape(-1, 2)
+    texts = np.array([tweet['text'] for _, tweet in tweets], dtype=object)
+    return ids, coordinates, texts
+
+############################################################################################################
+# Build one scatter trace for the plot
+# Large-data mode uses WebGL (Scattergl), smaller markers and truncated hover labels;
+# the full text of a point is shown below the plot when it is selected.
+############################################################################################################
+def scatter_trace(coordinates, texts, color, name, large_data):
+    """One marker trace; WebGL with truncated hover labels in large-data mode"""
+    trace_type = go.Scattergl if large_data else go.Scatter
+    return trace_type(
+        x=coordinates[:, 0],
+        y=coordinates[:, 1],
+        mode='markers',
+        name=name,
+        text=truncate_hover_text(texts) if large_data else texts,
+        hovertemplate='<b>Tweet:</b><br>%{text}<extra></extra>',
+        marker=dict(
+            size=5 if large_data else 8,
+            color=color,
+            opacity=0.7
+        )
+    )
 
 embeddings_file = get_embeddings_file()
 if not embeddings_file:
     st.stop()
 
-# Initialize session state
-if 'test_tweets_coordinates' not in st.session_state:
-    st.session_state.test_tweets_coordinates = {}
+overlay = get_tweet_overlay(embeddings_file)
 
 st.sidebar.header("Add Test Tweet")
 
@@ -292,129 +398,189 @@ with st.sidebar:
         placeholder="Type your test tweet here...",
         height=100
     )
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col1:
         if st.button("Add Test Tweet", type="primary"):
-            if test_tweet_input.strip():
+            if 'current_layout' not in st.session_state:
+                st.warning("The UMAP layout is still being fitted, please try again in a moment.")
+            elif test_tweet_input.strip():
                 try:
-                    test_id = add_test_tweet_to_csv(test_tweet_input.strip(), embeddings_file)
-                    
+                    test_id = add_test_tweet(test_tweet_input.strip(), overlay, st.session_state.current_layout)
+
                     if test_id:
-                        test_id, test_embedding = test_id
-                        
-                        # Get the fitted UMAP model
-                        reducer, _, _ = load_base_tweets_and_fit_umap(n_neighbors, min_dist, spread, max_tweets)
-                        
-                        # Transform this single test tweet
-                        test_coordinates = reducer.transform([test_embedding])
-                        
-                        # Store coordinates in session state
-                        st.session_state.test_tweets_coordinates[str(test_id)] = {
-                            'text': test_tweet_input.strip(),
-                            'coordinates': test_coordinates[0]
-                        }
-                        
                         st.success(f"Test tweet added successfully!")
                         st.rerun()
-                    
+
                 except Exception as e:
                     st.error(f"Error adding test tweet: {str(e)}")
             else:
                 st.warning("Please enter some text for the test tweet.")
-    
+
     with col2:
         if st.button("Remove All Test Tweets", type="secondary"):
-            try:
-                removed_count = remove_test_tweets_from_csv(embeddings_file)
-                
-                # Clear session state coordinates
-                st.session_state.test_tweets_coordinates = {}
-                               
-                if removed_count > 0:
-                    st.success(f"Removed {removed_count} test tweets!")
-                else:
-                    st.info("No test tweets found to remove.")
-                    
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error removing test tweets: {str(e)}")
-
-    # Display currently added test tweets
-    if st.session_state.test_tweets_coordinates:
-        st.subheader("Test Tweets Added This Session:")
-        for i, (tweet_id, tweet_data) in enumerate(st.session_state.test_tweets_coordinates.items(), 1):
+            removed_count = overlay.clear()
+
+            if removed_count > 0:
+                st.success(f"Removed {removed_count} test tweets!")
+            else:
+                st.info("No test tweets found to remove.")
+
+            st.rerun()
+
+    # Display current test tweets, each with its own remove button
+    test_tweets = overlay.items()
+    if test_tweets:
+        st.subheader("Test Tweets:")
+        for i, (tweet_id, tweet_data) in enumerate(test_tweets, 1):
             tweet_text = tweet_data['text']
-            st.write(f"{i}. {tweet_text[:50]}{'...' if len(tweet_text) > 50 else ''}")
+            text_col, remove_col = st.columns([5, 1])
+            text_col.write(f"{i}. {tweet_text[:50]}{'...' if len(tweet_text) > 50 else ''}")
+            if remove_col.button("✖", key=f"remove_{tweet_id}", help="Remove this test tweet"):
+                overlay.remove(tweet_id)
+                st.rerun()
 
-# Load base model and coordinates (cached)
-reducer, base_coordinates, base_indices = load_base_tweets_and_fit_umap(n_neighbors, min_dist, spread, max_tweets)
+    # Query embedding cache statistics (shared by all sessions)
+    with st.expander("Embedding cache", expanded=False):
+        cache_stats = get_query_embedding_cache().stats()
+        st.write(f"Hit rate: {cache_stats['hit_rate']:.0%}")
+        st.write(f"In memory: {cache_stats['memory_hits']} hits, {cache_stats['entries']}/{cache_stats['max_entries']} entries")
+        st.write(f"On disk: {cache_stats['backing_hits']} hits")
+        st.write(f"LM Studio requests: {cache_stats['misses']} ({cache_stats['coalesced']} duplicates coalesced)")
 
-# Load current data (includes any test tweets in CSV)
-df = load_current_data()
+    # Resident memory of the server process; the embedding matrix is shared by all sessions
+    with st.expander("Server memory", expanded=False):
+        rss = process_rss_bytes()
+        st.write(f"Resident memory: {rss / 1024 ** 2:,.0f} MB" if rss is not None else "Resident memory: unavailable")
+        loaded = load_current_data()
+        if loaded is not None:
+            matrix = loaded[1]
+            sharing = "memory-mapped, shared" if isinstance(matrix, np.memmap) else "in memory"
+            st.write(f"Embedding matrix: {matrix.nbytes / 1024 ** 2:,.1f} MB ({sharing})")
+            st.caption("Memory-mapped pages count toward resident memory once read, but are shared "
+                       "with other processes through the OS page cache")
 
-st.write(f"Loaded {len(base_coordinates)} base tweets")
+# Load base model and coordinates; fits run in the background while the last layout stays on screen
+layout = load_base_tweets_and_fit_umap(n_neighbors, min_dist, spread, max_tweets, incremental, refit_percent / 100,
+                                       sampling, pca_dim)
+fit_in_progress = layout is None
 
-all_coordinates = []
-all_texts = []
-all_colors = []
+if layout is not None:
+    st.session_state.current_layout = layout
+else:
+    state, fraction, message = st.session_state.fit_scheduler.current.poll()
+    if state == 'done':
+        # The worker has written the layout to disk; pick it up on the next run
+        st.rerun()
+    elif state == 'error':
+        fit_in_progress = False
+        st.error(f"UMAP fit failed:\n\n{message}")
+    else:
+        st.progress(fraction, text=f"⏳ Fitting UMAP in the background: {message}")
 
-# Add base tweets
-for i, coord in enumerate(base_coordinates):
-    all_coordinates.append(coord)
-    all_texts.append(df.iloc[base_indices[i]]['full_text'])
-    all_colors.append(px.colors.qualitative.Set3[0])  # Blue for base tweets
+layout = st.session_state.get('current_layout')
+if layout is None:
+    if fit_in_progress:
+        time.sleep(1.0)
+        st.rerun()
+    st.stop()
 
-# Add test tweets from session state coordinates
-test_tweet_count = 0
+if 'explained_variance' in layout:
+    explained_variance_slot.caption(f"PCA keeps {layout['explained_variance']:.1%} of the variance")
 
-for tweet_id, tweet_data in st.session_state.test_tweets_coordinates.items():
-    
-    # Check if this test tweet exists in the CSV
-    tweet_found = False
-    for i in range(len(df)):
-        csv_id = str(df.iloc[i].iloc[0]) if pd.notna(df.iloc[i].iloc[0]) else ""
-        if csv_id == tweet_id:
-            tweet_found = True
-            break
-    
-    if tweet_found:
-        all_coordinates.append(tweet_data['coordinates'])
-        all_texts.append(tweet_data['text'])
-        all_colors.append('red')  # Red for test tweets
-        test_tweet_count += 1
+reducer = layout['reducer']
+base_coordinates = layout['coordinates']
+base_indices = layout['indices']
+
+if fit_in_progress:
+    st.caption("Showing the last completed layout until the new one is ready.")
+elif layout.get('new_points'):
+    st.info(f"➕ Added {layout['new_points']:,} new tweets to the existing layout without refitting")
+elif layout.get('fitted_points', len(base_indices)) < len(base_indices):
+    st.info(f"📊 UMAP fitted on a coreset of {layout['fitted_points']:,} tweets; the other "
+            f"{len(base_indices) - layout['fitted_points']:,} were projected into the layout")
+elif layout['total_base_tweets'] > max_tweets:
+    st.info(f"📊 Sampled {len(base_indices):,} base tweets from {layout['total_base_tweets']:,} total")
+
+# Load current data
+df, _ = load_current_data()
+
+st.write(f"Loaded {len(base_coordinates)} base tweets")
+
+# Row positions of the layout index into the current data; guard against a file that has shrunk since the fit
+base_indices = np.asarray(base_indices, dtype=np.int64)
+on_screen = base_indices < len(df)
+base_coordinates = np.asarray(base_coordinates).reshape(-1, 2)[on_screen]
+base_texts = df['full_text'].to_numpy(dtype=object)[base_indices[on_screen]]
+
+# Add test tweets from the overlay store
+_, test_coordinates, test_texts = place_test_tweets(overlay, layout)
+test_tweet_count = len(test_texts)
 
 if test_tweet_count > 0:
     st.info(f"Currently showing {test_tweet_count} test tweets in red")
 
-# Convert coordinates to arrays for plotting
-if all_coordinates:
-    coordinates_array = np.array(all_coordinates)
-    
-    fig = go.Figure(data=go.Scatter(
-        x=coordinates_array[:, 0],
-        y=coordinates_array[:, 1],
-        mode='markers',
-        text=all_texts,
-        hovertemplate='<b>Tweet:</b><br>%{text}<extra></extra>',
-        marker=dict(
-            size=8,
-            color=all_colors,
-            opacity=0.7
-        )
-    ))
+# Choose the level of detail for the plot
+total_points = len(base_texts) + len(test_texts)
+large_data = render_mode == "Large data (WebGL)" or (render_mode == "Auto" and total_points > LARGE_DATA_THRESHOLD)
+
+# Test tweets are always drawn; base tweets are thinned by density once over the point budget
+plotted_base = density_downsample(base_coordinates, max_plotted_points - len(test_texts))
+if len(plotted_base) < len(base_texts):
+    st.caption(f"Drawing {len(plotted_base):,} of {len(base_texts):,} base tweets; dense clusters are thinned.")
+
+plotted_base_texts = base_texts[plotted_base]
+
+if total_points:
+    fig = go.Figure(data=[
+        scatter_trace(base_coordinates[plotted_base], plotted_base_texts,
+                      px.colors.qualitative.Set3[0], "Original tweets", large_data),  # Blue for base tweets
+        scatter_trace(test_coordinates, test_texts, 'red', "Test tweets", large_data)  # Red for test tweets
+    ])
     
     fig.update_layout(
         title="Tweet Embeddings Cluster",
         xaxis_title="UMAP Dimension 1",
         yaxis_title="UMAP Dimension 2",
         yaxis=dict(autorange=True),
+        showlegend=False
     )
     
-    st.plotly_chart(fig, key='tweet_embedding_plot')
+    # Clicking or box-selecting points shows their full text below the plot
+    event = st.plotly_chart(fig, key='tweet_embedding_plot', on_select="rerun", selection_mode=('points', 'box', 'lasso'))
     
     st.markdown("**Legend:** 🔴 Red dots = Test tweets | 🔵 Blue dots = Original tweets")
+
+    selected_points = event.selection.points if event else []
+    if selected_points:
+        trace_texts = [plotted_base_texts, test_texts]
+        st.subheader(f"Selected tweets ({len(selected_points)})")
+        for point in selected_points[:20]:
+            st.write(trace_texts[point['curve_number']][point['point_index']])
+        if len(selected_points) > 20:
+            st.caption(f"... and {len(selected_points) - 20:,} more")
 else:
-    st.error("No valid coordinates to display")
\ No newline at end of file
+    st.error("No valid coordinates to display")
+
+# Most similar base tweets to a test tweet, in the original embedding space
+test_tweets = overlay.items()
+if test_tweets:
+    st.subheader("🔎 Most similar tweets")
+    query_col, k_col = st.columns([3, 1])
+    # Newest test tweet first
+    query_id = query_col.selectbox("Test tweet", [tweet_id for tweet_id, _ in reversed(test_tweets)],
+                                   format_func=lambda tweet_id: overlay.tweets[tweet_id]['text'][:80])
+    top_k = k_col.number_input("Top k", min_value=1, max_value=100, value=10)
+
+    start_time = time.perf_counter()
+    similar_tweets = find_similar_tweets(overlay.tweets[query_id]['embedding'], top_k)
+    st.caption(f"Cosine similarity over the original embeddings, {(time.perf_counter() - start_time) * 1000:.0f} ms")
+    st.dataframe(similar_tweets, hide_index=True, column_config={
+        'similarity': st.column_config.NumberColumn(format="%.3f")
+    })
+
+# Poll the background fit until it finishes, then pick up the new layout
+if fit_in_progress:
+    time.sleep(1.0)
+    st.rerun()
\ No newline at end of file
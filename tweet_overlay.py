@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+###############################################################################################
+# tweet_overlay.py
+# Overlay store for the test tweets added in the Streamlit app, kept next to the embeddings
+# file instead of inside it. Each test tweet holds its text, embedding and the 2D coordinates it
+# was projected to, per layout. The file is an append-only JSON-lines log of add / place /
+# remove / clear records, so adding or removing a tweet writes one line and the base dataset is
+# never touched. The log is compacted once dead records outnumber live tweets.
+###############################################################################################
+
+
+def overlay_path_for(embeddings_file):
+    """Path of the test-tweet overlay log that belongs to an embeddings file"""
+    base = embeddings_file[:-len('.meta.csv')] if embeddings_file.endswith('.meta.csv') else os.path.splitext(embeddings_file)[0]
+    return f"{base}.test_tweets.jsonl"
+
+
+class TweetOverlayStore:
+    """Append-only log of test tweets, replayed into memory on open"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tweets = {}
+        self._records = 0
+        self._lock = threading.Lock()
+        self._replay()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Partial last line from an interrupted write
+                self._apply(record)
+                self._records += 1
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'add':
+            self.tweets[record['id']] = {
+                'text': record['text'],
+                'embedding': record['embedding'],
+                'coordinates': {}
+            }
+        elif op == 'place' and record['id'] in self.tweets:
+            self.tweets[record['id']]['coordinates'][record['layout']] = record['coordinates']
+        elif op == 'remove':
+            self.tweets.pop(record['id'], None)
+        elif op == 'clear':
+            self.tweets.clear()
+
+    def _append(self, records):
+        """Apply records in memory and append them to the log"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        for record in records:
+            self._apply(record)
+        self._records += len(records)
+
+        if self._records > 2 * self._live_records() + 100:
+            self._compact()
+
+    def _live_records(self):
+        return sum(1 + len(tweet['coordinates']) for tweet in self.tweets.values())
+
+    def _compact(self):
+        """Rewrite the log with only the live tweets"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for tweet_id, tweet in self.tweets.items():
+                f.write(json.dumps({'op': 'add', 'id': tweet_id, 'text': tweet['text'],
+                                    'embedding': tweet['embedding']}) + '\n')
+                for layout, coordinates in tweet['coordinates'].items():
+                    f.write(json.dumps({'op': 'place', 'id': tweet_id, 'layout': layout,
+                                        'coordinates': coordinates}) + '\n')
+        os.replace(temp_path, self.path)
+        self._records = self._live_records()
+
+    def add(self, tweet_id, text, embedding, layout=None, coordinates=None):
+        """Add a test tweet, optionally with its coordinates in `layout`"""
+        records = [{'op': 'add', 'id': tweet_id, 'text': text, 'embedding': list(map(float, embedding))}]
+        if layout is not None:
+            records.append({'op': 'place', 'id': tweet_id, 'layout': layout,
+                            'coordinates': list(map(float, coordinates))})
+        with self._lock:
+            self._append(records)
+
+    def place(self, layout, coordinates_by_id):
+        """Record coordinates of existing test tweets in `layout`"""
+        records = [{'op': 'place', 'id': tweet_id, 'layout': layout, 'coordinates': list(map(float, coordinates))}
+                   for tweet_id, coordinates in coordinates_by_id.items()]
+        with self._lock:
+            self._append(records)
+
+    def remove(self, tweet_id):
+        with self._lock:
+            if tweet_id in self.tweets:
+                self._append([{'op': 'remove', 'id': tweet_id}])
+
+    def clear(self):
+        """Remove all test tweets; returns how many there were"""
+        with self._lock:
+            count = len(self.tweets)
+            if count:
+                self._append([{'op': 'clear'}])
+            return count
+
+    def items(self):
+        """Snapshot of (tweet_id, tweet) pairs in insertion order"""
+        with self._lock:
+            return list(self.tweets.items())
+
+    def unplaced(self, layout):
+        """(tweet_id, embedding) of test tweets without coordinates in `layout`"""
+        return [(tweet_id, tweet['embedding']) for tweet_id, tweet in self.items()
+                if layout not in tweet['coordinates']]
@@ -0,0 +1,57 @@
+from urllib.parse import quote
+
+###############################################################################################
+# tweet_pages.py
+# Keyset pagination over the Supabase (PostgREST) /tweets endpoint, shared by collect_tweets.py
+# and collect_all_tweets.py. Pages are ordered by tweet_id and each request asks for the rows
+# after the last key of the previous page (tweet_id=gt.<key>) instead of using limit/offset,
+# which makes the database re-scan every skipped row and slows deep pages down quadratically.
+# The last key of a page is also an exact resume point for checkpoints.
+# Optionally only some columns are requested (PostgREST select=) and cheap filters are applied
+# by the server (e.g. full_text=not.like.RT @*), so fewer bytes are sent and decoded.
+###############################################################################################
+
+# Sort and resume key; it must be unique, or rows sharing a key across a page boundary are skipped
+TWEET_KEY_COLUMN = 'tweet_id'
+PAGE_SIZE = 1000
+
+# Server-side filter dropping retweets (PostgREST like uses * as the wildcard)
+RETWEET_FILTER = ('full_text', 'not.like.RT @*')
+
+
+def tweets_page_url(base_url, account_id, after_key=None, limit=PAGE_SIZE, select=None, filters=()):
+    """
+    URL of the page of an account's tweets that follows `after_key` (the first page if None).
+    `select` is a PostgREST column list (it must include TWEET_KEY_COLUMN), `filters` are
+    (column, condition) pairs such as RETWEET_FILTER.
+    """
+    url = f"{base_url}/tweets?account_id=eq.{account_id}&order={TWEET_KEY_COLUMN}.asc&limit={limit}"
+    if select:
+        url += f"&select={quote(select, safe=',:')}"
+    for column, condition in filters:
+        url += f"&{column}={quote(condition, safe='.*')}"
+    if after_key is not None:
+        url += f"&{TWEET_KEY_COLUMN}=gt.{quote(str(after_key), safe='')}"
+    return url
+
+
+def iter_tweet_pages(get, base_url, account_id, after_key=None, limit=PAGE_SIZE, select=None, filters=()):
+    """
+    Yield (tweets, last_key) for each page of an account's tweets after `after_key`.
+    `get(url)` performs the request (e.g. a session's get with auth headers).
+    Raises RuntimeError if the server answers with anything but 200.
+    """
+    while True:
+        response = get(tweets_page_url(base_url, account_id, after_key, limit, select, filters))
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+        tweets = response.json()
+        if not tweets:
+            return
+
+        after_key = tweets[-1][TWEET_KEY_COLUMN]
+        yield tweets, after_key
+
+        if len(tweets) < limit:
+            return
@@ -0,0 +1,60 @@
+import json
+import os
+from datetime import datetime
+
+from embedding_checkpoint import write_json_atomic
+
+###############################################################################################
+# tweet_sync_state.py
+# State store for incremental syncs of collect_all_tweets.py. It remembers the dataset CSV of the
+# last completed collection and, per account, the high-water mark: the newest tweet_id fetched
+# (kept or filtered). `collect_all_tweets.py --sync` fetches only tweets after each account's mark
+# (tweets are paged in tweet_id order, see tweet_pages.py) and appends them to that CSV.
+# The file is small JSON, rewritten atomically after each completed run.
+###############################################################################################
+
+DEFAULT_SYNC_STATE_FILE = 'tweet_sync_state.json'
+
+
+def load_sync_state(state_filename=DEFAULT_SYNC_STATE_FILE):
+    """The sync state, or None if there is none yet (or it is unreadable)"""
+    if not os.path.exists(state_filename):
+        return None
+    try:
+        with open(state_filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️ Unreadable sync state: {state_filename}, ignoring it")
+        return None
+
+
+def high_water_marks(state):
+    """{username: newest tweet_id fetched} from a sync state (empty for None)"""
+    if not state:
+        return {}
+    return {username: account['last_tweet_id'] for username, account in state.get('accounts', {}).items()
+            if account.get('last_tweet_id') is not None}
+
+
+def record_completed_run(csv_filename, fetch_mode, last_keys, incremental,
+                         state_filename=DEFAULT_SYNC_STATE_FILE):
+    """
+    Point the sync state at `csv_filename` after a completed run and store the accounts' new
+    high-water marks (`last_keys`: username -> newest tweet_id fetched, None if the account has no tweets).
+    An incremental run updates the marks it fetched; a full run replaces the state.
+    """
+    state = (load_sync_state(state_filename) if incremental else None) or {}
+    if state.get('csv_filename') != csv_filename:
+        state['accounts'] = {}
+    accounts = state.setdefault('accounts', {})
+
+    synced_at = datetime.now().isoformat()
+    for username, last_key in last_keys.items():
+        if last_key is None and username in accounts:
+            # Nothing fetched; keep the previous mark
+            last_key = accounts[username].get('last_tweet_id')
+        accounts[username] = {'last_tweet_id': last_key, 'last_synced': synced_at}
+
+    state.update(csv_filename=csv_filename, fetch_mode=fetch_mode, last_updated=synced_at)
+    write_json_atomic(state_filename, state)
+    return state
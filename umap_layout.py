@@ -0,0 +1,427 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import umap
+
+from embedding_store import is_embedding_store, load_tweet_dataset, npy_path_for, tweet_id_column
+from layout_cache import LayoutCache, file_content_hash, layout_key, build_knn_graph, slice_knn_graph
+from pca_reduction import PcaReducer, ReducedUMAP
+from sampling import coreset_sample
+
+###############################################################################################
+# umap_layout.py
+# Loads an embeddings file and fits the 2D UMAP layout shown by the Streamlit app. Kept out of
+# streamlit_app.py so the fit can run in a background worker process (see background_fit.py).
+# Fitted layouts and kNN graphs are stored in the on-disk LayoutCache.
+#
+# Incremental mode: when a new embeddings file arrives, the last layout fitted with the same
+# parameters is diffed against it by tweet ID. Tweets it already placed keep their coordinates,
+# only new tweets are projected through its reducer, and a full refit happens only once new
+# tweets make up more than refit_fraction of the data.
+#
+# Sampling: above max_tweets, "random" fits on a uniform sample and draws only that sample;
+# "coreset" fits on a k-means coreset of max_tweets tweets (see sampling.py), which keeps small
+# clusters, and projects every other tweet into the layout in batches.
+#
+# Out of core: with a binary embedding store (.meta.csv + .npy) the vectors stay memory-mapped.
+# UMAP, PCA and k-means are fitted on bounded samples, and the remaining tweets are projected by
+# worker processes that read their batches straight from the .npy file and write coordinates
+# into a memory-mapped output, so laying out the whole archive never loads the full matrix.
+#
+# PCA pre-reduction (pca_dim): vectors are L2-normalized and reduced with randomized PCA before
+# the neighbour search and UMAP, which then use the Euclidean metric (equivalent to cosine on
+# normalized vectors). The fitted PCA is cached per dataset hash (see pca_reduction.py).
+###############################################################################################
+
+# Default share of new tweets above which incremental mode refits instead of projecting
+DEFAULT_REFIT_FRACTION = 0.2
+
+# PCA is fitted on at most this many random tweets; the components barely change beyond that
+PCA_FIT_ROWS = 100_000
+
+
+def embeddings_file_hash(embeddings_file):
+    """Content hash of the embeddings file (and its .npy vectors for binary stores)"""
+    if is_embedding_store(embeddings_file):
+        return file_content_hash(embeddings_file, npy_path_for(embeddings_file))
+    return file_content_hash(embeddings_file)
+
+
+SAMPLING_MODES = ('random', 'coreset')
+
+
+def _layout_params(n_neighbors, min_dist, spread, max_tweets, sampling, pca_dim):
+    params = dict(n_neighbors=n_neighbors, min_dist=min_dist, spread=spread, max_tweets=max_tweets)
+    # Random sampling without PCA keeps the keys layouts had before these options existed
+    if sampling != 'random':
+        params['sampling'] = sampling
+    if pca_dim:
+        params['pca_dim'] = pca_dim
+    return params
+
+
+def layout_cache_key(data_hash, n_neighbors, min_dist, spread, max_tweets, incremental=False, sampling='random',
+                     pca_dim=None):
+    """LayoutCache key of a fitted layout; incremental layouts may extend an older one"""
+    params = _layout_params(n_neighbors, min_dist, spread, max_tweets, sampling, pca_dim)
+    if incremental:
+        params['incremental'] = True
+    return layout_key(data_hash, **params)
+
+
+def latest_layout_key(n_neighbors, min_dist, spread, max_tweets, sampling='random', pca_dim=None):
+    """LayoutCache key of the pointer to the newest layout fitted with these parameters"""
+    return layout_key('latest', **_layout_params(n_neighbors, min_dist, spread, max_tweets, sampling, pca_dim))
+
+
+def _knn_key(data_hash, max_tweets, knn_neighbors, sampling, pca_dim):
+    params = dict(max_tweets=max_tweets, n_neighbors=knn_neighbors, metric='cosine')
+    if sampling != 'random':
+        params['sampling'] = sampling
+    if pca_dim:
+        params.update(pca_dim=pca_dim, metric='euclidean')
+    return layout_key(data_hash, kind='knn', **params)
+
+
+def fit_pca_reducer(embedding_matrix, rows, data_hash, pca_dim, layout_cache, progress=None):
+    """
+    PcaReducer for the vectors at `rows` of a dataset's embedding matrix, fitted on up to
+    PCA_FIT_ROWS of them at random and cached per dataset hash
+    """
+    pca_key = layout_key(data_hash, kind='pca', pca_dim=pca_dim)
+    pca_reducer = layout_cache.get(pca_key)
+    if pca_reducer is None:
+        if progress:
+            progress(0.1, f"Reducing embeddings to {pca_dim} dimensions with PCA (once per dataset)")
+        if len(rows) > PCA_FIT_ROWS:
+            rows = np.sort(np.random.default_rng(42).choice(rows, size=PCA_FIT_ROWS, replace=False))
+        pca_reducer = PcaReducer(pca_dim).fit(np.asarray(embedding_matrix[rows]))
+        layout_cache.put(pca_key, pca_reducer)
+    return pca_reducer
+
+
+##################################################################################################
+# Batched, parallel transform of new points
+##################################################################################################
+_worker_reducer = None
+
+
+def _init_transform_worker(reducer_bytes):
+    global _worker_reducer
+    _worker_reducer = pickle.loads(reducer_bytes)
+
+
+def _transform_batch(batch):
+    return _worker_reducer.transform(batch)
+
+
+def transform_in_batches(reducer, embeddings, batch_rows=4096, workers=None):
+    """
+    Project `embeddings` through a fitted reducer in batches of `batch_rows`.
+    Batches are spread over `workers` processes (default: one per CPU) that each unpickle the
+    reducer once. Call it from a worker process or script, not from the Streamlit server.
+    """
+    batches = [embeddings[start:start + batch_rows] for start in range(0, len(embeddings), batch_rows)]
+    if not batches:
+        return np.zeros((0, 2), dtype=np.float32)
+
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if workers <= 1:
+        return np.vstack([reducer.transform(batch) for batch in batches])
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_transform_worker, initargs=(pickle.dumps(reducer),)) as pool:
+        return np.vstack(list(pool.map(_transform_batch, batches)))
+
+
+_worker_projection = None
+
+
+def _init_projection_worker(reducer_bytes, vectors_path, rows, out_path):
+    global _worker_projection
+    _worker_projection = (pickle.loads(reducer_bytes), np.load(vectors_path, mmap_mode='r'), rows,
+                          np.load(out_path, mmap_mode='r+'))
+
+
+def _project_range(start, stop):
+    reducer, vectors, rows, out = _worker_projection
+    out[start:stop] = reducer.transform(np.asarray(vectors[rows[start:stop]]))
+    out.flush()
+    return stop - start
+
+
+def project_out_of_core(reducer, vectors_path, rows, out_path, batch_rows=4096, workers=None, progress=None):
+    """
+    Project rows `rows` of the .npy file `vectors_path` through a fitted reducer into a new
+    (len(rows), 2) float32 .npy file at `out_path`, returned memory-mapped. Worker processes read
+    their own batches from the file and write their coordinates in place, so neither the vectors
+    nor the coordinates pass through this process. `progress(done, total)` is called per batch.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(len(rows), 2)).flush()
+    ranges = [(start, min(start + batch_rows, len(rows))) for start in range(0, len(rows), batch_rows)]
+    reducer_bytes = pickle.dumps(reducer)
+    done = 0
+
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    if workers <= 1:
+        _init_projection_worker(reducer_bytes, vectors_path, rows, out_path)
+        for start, stop in ranges:
+            done += _project_range(start, stop)
+            if progress:
+                progress(done, len(rows))
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_projection_worker,
+                                 initargs=(reducer_bytes, vectors_path, rows, out_path)) as pool:
+            for future in as_completed([pool.submit(_project_range, start, stop) for start, stop in ranges]):
+                done += future.result()
+                if progress:
+                    progress(done, len(rows))
+
+    return np.load(out_path, mmap_mode='r')
+
+
+def _project_rows(reducer, embedding_matrix, rows, progress, fraction, label):
+    """
+    2D coordinates of rows `rows` of the embedding matrix: out of core when it is memory-mapped
+    from a .npy file, otherwise with transform_in_batches on the in-memory rows
+    """
+    progress(fraction, f"Projecting {len(rows):,} {label}")
+    vectors_path = getattr(embedding_matrix, 'filename', None)
+    if vectors_path is None or len(rows) == 0:
+        return transform_in_batches(reducer, np.asarray(embedding_matrix[rows]))
+
+    report = lambda done, total: progress(fraction, f"Projecting {label}: {done:,}/{total:,}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        coordinates = project_out_of_core(reducer, vectors_path, rows, os.path.join(tmp_dir, 'coordinates.npy'),
+                                          progress=report)
+        # 8 bytes per tweet; copy out before the temporary file goes away
+        return np.array(coordinates)
+
+
+##################################################################################################
+# Fitting
+##################################################################################################
+def fit_layout(embeddings_file, data_hash, n_neighbors, min_dist, spread, max_tweets, knn_neighbors,
+               layout_cache=None, progress=None, incremental=False, refit_fraction=DEFAULT_REFIT_FRACTION,
+               sampling='random', pca_dim=None):
+    """
+    Load base tweets (excluding test tweets), fit UMAP and store the result in the layout cache.
+    With `incremental`, the newest layout fitted with the same parameters is extended instead
+    when no more than `refit_fraction` of the tweets are new to it.
+    `sampling` is 'random' or 'coreset'; `pca_dim` (None for off) enables PCA pre-reduction
+    (see the module comment).
+    `progress(fraction, message)` is called between stages if given.
+    Returns the layout dict: reducer, coordinates, indices (row positions in the embeddings file),
+    ids (tweet IDs of the points), data_ids (every base tweet ID in the file), total_base_tweets
+    (before sampling), fitted_points (tweets UMAP was fitted on) and new_points (tweets projected
+    into an older layout, 0 for a full fit), plus explained_variance with PCA pre-reduction.
+    """
+    layout_cache = layout_cache or LayoutCache()
+    progress = progress or (lambda fraction, message: None)
+
+    progress(0.05, "Loading embeddings file")
+    df, embedding_matrix = load_tweet_dataset(embeddings_file)
+
+    # Split into base tweets and test tweets BEFORE sampling
+    test_tweets_mask = df.iloc[:, 0].str.startswith('999', na=False)
+    base_tweets_df = df[~test_tweets_mask]
+
+    # Tweets without a valid vector have embedding_row -1 and are never drawn
+    with_vector_df = base_tweets_df[base_tweets_df['embedding_row'].to_numpy() >= 0]
+    # Without a column that identifies every tweet, layouts can't be matched across file versions
+    id_column = tweet_id_column(with_vector_df)
+    data_ids = _tweet_ids(with_vector_df, id_column)
+
+    pointer_key = latest_layout_key(n_neighbors, min_dist, spread, max_tweets, sampling, pca_dim)
+    layout = None
+    if incremental:
+        pointer = layout_cache.get(pointer_key)
+        previous = layout_cache.get(pointer['layout_key']) if pointer else None
+        if id_column is None:
+            progress(0.1, "No unique tweet ID column, refitting")
+        elif previous is not None and 'data_ids' in previous and previous.get('id_column') == id_column:
+            is_new = ~pd.Index(data_ids).isin(previous['data_ids'])
+            new_fraction = is_new.mean() if len(data_ids) else 0.0
+            if new_fraction <= refit_fraction:
+                # Coreset layouts draw every tweet, so only random sampling limits the extension
+                max_points = max_tweets if sampling == 'random' else None
+                layout = _extend_layout(previous, with_vector_df, data_ids, is_new, embedding_matrix,
+                                        max_points, progress)
+            else:
+                progress(0.1, f"{new_fraction:.0%} of the tweets are new, refitting")
+
+    full_fit = layout is None
+    pca_reducer = None
+    if full_fit and pca_dim:
+        pca_reducer = fit_pca_reducer(embedding_matrix, with_vector_df['embedding_row'].to_numpy(),
+                                      data_hash, pca_dim, layout_cache, progress)
+    knn_key = _knn_key(data_hash, max_tweets, knn_neighbors, sampling, pca_dim)
+    if full_fit and sampling == 'coreset':
+        layout = _fit_coreset_layout(with_vector_df, data_ids, embedding_matrix, knn_key, pca_reducer,
+                                     n_neighbors, min_dist, spread, max_tweets, knn_neighbors, layout_cache,
+                                     progress)
+    elif full_fit:
+        layout = _fit_full_layout(base_tweets_df, id_column, embedding_matrix, knn_key, pca_reducer, n_neighbors,
+                                  min_dist, spread, max_tweets, knn_neighbors, layout_cache, progress)
+    if pca_reducer is not None:
+        layout['explained_variance'] = pca_reducer.explained_variance
+
+    layout['data_ids'] = frozenset(data_ids)
+    layout['id_column'] = id_column
+    layout['total_base_tweets'] = len(base_tweets_df)
+
+    progress(0.95, "Saving layout")
+    cache_key = layout_cache_key(data_hash, n_neighbors, min_dist, spread, max_tweets, incremental, sampling,
+                                 pca_dim)
+    if full_fit:
+        # A full fit is also the answer for the non-incremental key
+        layout_cache.put(layout_cache_key(data_hash, n_neighbors, min_dist, spread, max_tweets,
+                                          sampling=sampling, pca_dim=pca_dim), layout)
+    layout_cache.put(cache_key, layout)
+    layout_cache.put(pointer_key, {'layout_key': cache_key, 'data_hash': data_hash})
+    progress(1.0, "Done")
+    return layout
+
+
+def _fit_full_layout(base_tweets_df, id_column, embedding_matrix, knn_key, pca_reducer, n_neighbors, min_dist,
+                     spread, max_tweets, knn_neighbors, layout_cache, progress):
+    """Fit UMAP from scratch on (a sample of) the base tweets"""
+    if len(base_tweets_df) > max_tweets:
+        base_tweets_df = base_tweets_df.sample(n=max_tweets, random_state=42)
+
+    embedding_rows = base_tweets_df['embedding_row'].to_numpy()
+    valid = embedding_rows >= 0
+    base_tweets_df = base_tweets_df[valid]
+    base_embeddings = np.asarray(embedding_matrix[embedding_rows[valid]])
+
+    reducer, base_coordinates = _fit_umap(base_embeddings, knn_key, pca_reducer, n_neighbors, min_dist, spread,
+                                          knn_neighbors, layout_cache, progress)
+
+    return {
+        'reducer': reducer,
+        'coordinates': base_coordinates,
+        # Row positions in the file, so the render step can look tweets up in the unsampled data
+        'indices': base_tweets_df.index.to_numpy().tolist(),
+        'ids': _tweet_ids(base_tweets_df, id_column).tolist(),
+        'fitted_points': len(base_embeddings),
+        'new_points': 0
+    }
+
+
+def _fit_coreset_layout(with_vector_df, data_ids, embedding_matrix, knn_key, pca_reducer, n_neighbors, min_dist,
+                        spread, max_tweets, knn_neighbors, layout_cache, progress):
+    """Fit UMAP on a k-means coreset of the base tweets and project all the others into it"""
+    embedding_rows = with_vector_df['embedding_row'].to_numpy()
+    # A binary store usually holds exactly these vectors in order; use it as is to stay memory-mapped
+    if np.array_equal(embedding_rows, np.arange(len(embedding_matrix))):
+        all_embeddings = embedding_matrix
+    else:
+        all_embeddings = embedding_matrix[embedding_rows]
+
+    progress(0.1, f"Selecting a coreset of {min(max_tweets, len(with_vector_df)):,} tweets")
+    coreset = coreset_sample(all_embeddings, max_tweets)
+    rest = np.setdiff1d(np.arange(len(with_vector_df)), coreset)
+
+    reducer, coreset_coordinates = _fit_umap(np.asarray(all_embeddings[coreset]), knn_key, pca_reducer,
+                                             n_neighbors, min_dist, spread, knn_neighbors, layout_cache, progress)
+
+    rest_coordinates = _project_rows(reducer, embedding_matrix, embedding_rows[rest], progress, 0.8,
+                                     "other tweets")
+
+    positions = np.concatenate([coreset, rest])
+    return {
+        'reducer': reducer,
+        'coordinates': np.vstack([coreset_coordinates, rest_coordinates]).astype(np.float32),
+        'indices': with_vector_df.index.to_numpy()[positions].tolist(),
+        'ids': data_ids[positions].tolist(),
+        'fitted_points': len(coreset),
+        'new_points': 0
+    }
+
+
+def _fit_umap(embeddings, knn_key, pca_reducer, n_neighbors, min_dist, spread, knn_neighbors, layout_cache,
+              progress):
+    """
+    Fit UMAP with a kNN graph cached under `knn_key` (the graph only depends on the data, so it is
+    built once at the largest k and reused); returns (reducer, coordinates). With a `pca_reducer`
+    the fit runs on reduced vectors and the reducer is wrapped to take raw embeddings.
+    """
+    metric = 'cosine'
+    if pca_reducer is not None:
+        embeddings = pca_reducer.transform(embeddings)
+        metric = 'euclidean'
+
+    knn_graph = layout_cache.get(knn_key)
+    if knn_graph is None:
+        progress(0.3, "Building nearest-neighbour graph (once per dataset)")
+        knn_graph = build_knn_graph(embeddings, knn_neighbors, metric=metric)
+        layout_cache.put(knn_key, knn_graph)
+    precomputed_knn = slice_knn_graph(knn_graph, n_neighbors) or (None, None, None)
+
+    progress(0.6, "Optimizing layout")
+    reducer = umap.UMAP(
+        n_components=2,
+        random_state=42,
+        spread=spread,
+        min_dist=min_dist,
+        n_neighbors=n_neighbors,
+        metric=metric,
+        precomputed_knn=precomputed_knn
+    )
+    coordinates = reducer.fit_transform(embeddings)
+    if pca_reducer is not None:
+        reducer = ReducedUMAP(pca_reducer, reducer)
+    return reducer, coordinates
+
+
+def _tweet_ids(df, id_column):
+    """Tweet IDs of the rows of `df` as strings (their row positions if `id_column` is None)"""
+    if id_column is None:
+        return df.index.astype(str).to_numpy(dtype=object)
+    return df[id_column].fillna('').astype(str).to_numpy(dtype=object)
+
+
+def _extend_layout(previous, with_vector_df, data_ids, is_new, embedding_matrix, max_points, progress):
+    """
+    Keep the points of `previous` that are still in the data and project the new tweets into it,
+    up to `max_points` points in total (None for no limit). Returns None if the tweet IDs are not
+    unique, as the kept points could not be mapped back to their rows.
+    """
+    # Row position of each tweet ID in the new file
+    row_of = pd.Series(with_vector_df.index.to_numpy(), index=data_ids)
+    if not row_of.index.is_unique:
+        progress(0.1, "Tweet IDs are not unique, refitting")
+        return None
+
+    previous_ids = np.asarray(previous['ids'], dtype=object)
+    still_present = pd.Index(previous_ids).isin(row_of.index)
+    kept_ids = previous_ids[still_present]
+    kept_coordinates = np.asarray(previous['coordinates'])[still_present]
+
+    new_positions = np.flatnonzero(is_new)
+    room = len(new_positions) if max_points is None else max(max_points - len(kept_ids), 0)
+    if len(new_positions) > room:
+        new_positions = np.sort(np.random.default_rng(42).choice(new_positions, size=room, replace=False))
+
+    new_df = with_vector_df.iloc[new_positions]
+    new_coordinates = _project_rows(previous['reducer'], embedding_matrix, new_df['embedding_row'].to_numpy(),
+                                    progress, 0.3, "new tweets into the existing layout")
+
+    layout = {
+        'reducer': previous['reducer'],
+        'coordinates': np.vstack([kept_coordinates, new_coordinates]).astype(np.float32),
+        'indices': row_of[kept_ids].to_numpy().tolist() + new_df.index.to_numpy().tolist(),
+        'ids': kept_ids.tolist() + data_ids[new_positions].tolist(),
+        'fitted_points': previous.get('fitted_points', len(previous['ids'])),
+        'new_points': len(new_positions)
+    }
+    if 'explained_variance' in previous:
+        layout['explained_variance'] = previous['explained_variance']
+    return layout
@@ -0,0 +1,91 @@
+import numpy as np
+
+###############################################################################################
+# vector_index.py
+# Cosine-similarity search over the embedding matrix for the "most similar tweets" panel.
+# Small sets use exact blocked brute force (one matrix-vector product per block scaled by the
+# rows' precomputed inverse norms, top-k kept with argpartition); it reads the matrix in place,
+# so a memory-mapped matrix shared by all sessions is not copied. Above APPROXIMATE_MIN_ROWS an NNDescent graph (pynndescent, installed with umap-learn) answers
+# queries approximately instead.
+###############################################################################################
+
+# Below this many vectors exact search is fast enough (a few ms per 10k rows of 768-d vectors)
+APPROXIMATE_MIN_ROWS = 100_000
+
+
+def normalize_rows(matrix):
+    """float32 copy of `matrix` with unit-length rows (zero rows stay zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class BruteForceIndex:
+    """Exact cosine search, scanning the matrix in blocks to bound temporary memory"""
+
+    def __init__(self, embeddings, block_rows=16384):
+        # Kept as is (no normalized copy); only the inverse row norms are stored
+        self.vectors = embeddings
+        self.block_rows = block_rows
+        norms = np.ones(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), block_rows):
+            block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+            norms[start:start + len(block)] = np.linalg.norm(block, axis=1)
+        norms[norms == 0] = 1
+        self.inverse_norms = 1 / norms
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, k=10):
+        """Return (similarities, row positions) of the k most similar vectors, best first"""
+        query = normalize_rows(query).ravel()
+        k = min(k, len(self.vectors))
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+
+        for start in range(0, len(self.vectors), self.block_rows):
+            block = np.asarray(self.vectors[start:start + self.block_rows], dtype=np.float32)
+            scores = (block @ query) * self.inverse_norms[start:start + self.block_rows]
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        order = np.argsort(-best_scores)
+        return best_scores[order], best_rows[order]
+
+
+class ApproximateIndex:
+    """Approximate cosine search with an NNDescent graph over the normalized vectors"""
+
+    def __init__(self, embeddings, n_neighbors=30, random_state=42):
+        from pynndescent import NNDescent
+
+        self.vectors = normalize_rows(embeddings)
+        self.index = NNDescent(self.vectors, metric='dot', n_neighbors=n_neighbors, random_state=random_state)
+        self.index.prepare()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, k=10):
+        """Return (similarities, row positions) of (approximately) the k most similar vectors, best first"""
+        query = normalize_rows(query).reshape(1, -1)
+        rows, distances = self.index.query(query, k=min(k, len(self.vectors)))
+        # The 'dot' metric reports 1 - similarity as the distance
+        return 1 - distances[0], rows[0].astype(np.int64)
+
+
+def build_vector_index(embeddings, approximate_min_rows=APPROXIMATE_MIN_ROWS):
+    """Exact index for small matrices, approximate one from `approximate_min_rows` vectors up"""
+    if len(embeddings) >= approximate_min_rows:
+        return ApproximateIndex(embeddings)
+    return BruteForceIndex(embeddings)